@@ -0,0 +1,675 @@
+import argparse
+import gc
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import todo
+from todo import (BinaryBackend, JsonBackend, MemoryBackend, SqliteBackend, Task,
+                  ThreadSafeTodoList, TodoList)
+
+class DictTask:
+    """The original __dict__-based Task, kept for comparison"""
+    def __init__(self, title, description="", due_date=None, completed=False):
+        self.title = title
+        self.description = description
+        self.created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.due_date = due_date
+        self.completed = completed
+
+def measure(factory, count):
+    """Return (bytes per object, construction time per object in µs)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = [factory(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count, elapsed / count * 1e6
+
+def bench_memory(args):
+    # Titles are shared so only the per-task overhead is measured
+    title, description, due = "Task", "Description", "2024-10-31"
+    rows = [
+        ("dict Task", measure(lambda i: DictTask(title, description, due), args.count)),
+        ("slots Task", measure(lambda i: Task(title, description, due), args.count)),
+    ]
+    print(f"{args.count} tasks")
+    for name, (per_task, construct_us) in rows:
+        print(f"{name:12} {per_task:8.1f} bytes/task {construct_us:8.2f} µs/task")
+    saved = rows[0][1][0] - rows[1][1][0]
+    print(f"saving: {saved:.1f} bytes/task ({saved / rows[0][1][0]:.0%})")
+
+def write_tasks(filename, count):
+    """Write a todo.json with count synthetic tasks"""
+    with open(filename, 'w') as f:
+        json.dump([
+            Task(f"Task {i}", "Description " * 5, "2024-10-31", completed=i % 3 == 0).to_dict()
+            for i in range(count)
+        ], f, indent=2)
+
+def peak(func):
+    """Return (result, peak traced bytes) of calling func"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak_bytes
+
+def bench_stream(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        for count in args.counts:
+            write_tasks(filename, count)
+            todo_list = TodoList(filename, lazy=True)
+
+            def full_load():
+                with open(filename, 'r') as f:
+                    tasks = [Task.from_dict(data) for data in json.load(f)]
+                return sum(1 for task in tasks if not task.completed)
+
+            def streamed():
+                return sum(1 for task in todo_list.iter_tasks_from_file() if not task.completed)
+
+            pending, full_peak = peak(full_load)
+            streamed_pending, stream_peak = peak(streamed)
+            assert pending == streamed_pending
+            print(f"{count:>9} tasks  json.load peak {full_peak / 2**20:8.1f} MiB  "
+                  f"streaming peak {stream_peak / 2**20:6.2f} MiB")
+
+def bench_coldstart(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        for count in args.counts:
+            write_tasks(filename, count)
+            TodoList(filename).save_tasks()  # writes the counts sidecar
+            start = time.perf_counter()
+            TodoList(filename).counts()
+            eager = time.perf_counter() - start
+            start = time.perf_counter()
+            TodoList(filename, lazy=True).counts()
+            lazy = time.perf_counter() - start
+            print(f"{count:>9} tasks  eager {eager * 1e3:9.2f} ms  lazy {lazy * 1e3:7.3f} ms")
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def bench_durability(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        for journal in (False, True):
+            for policy in ("always", "periodic", "never"):
+                write_tasks(filename, args.count)
+                todo_list = TodoList(filename, journal=journal, durability=policy)
+                ids = list(todo_list.tasks_by_id)
+                latencies = []
+                for i in range(args.ops):
+                    start = time.perf_counter()
+                    todo_list.complete_task_by_id(ids[i % len(ids)])
+                    latencies.append(time.perf_counter() - start)
+                todo_list.wait_for_compaction()
+                total = sum(latencies)
+                mode = "journal" if journal else "rewrite"
+                print(f"{mode:8} {policy:9} {args.ops / total:9.1f} ops/s  "
+                      f"p50 {percentile(latencies, 0.5) * 1e3:8.3f} ms  "
+                      f"p99 {percentile(latencies, 0.99) * 1e3:8.3f} ms")
+
+def bench_write_behind(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        for journal in (False, True):
+            for write_behind in (False, True):
+                write_tasks(filename, args.count)
+                todo_list = TodoList(filename, journal=journal, write_behind=write_behind)
+                start = time.perf_counter()
+                for i in range(args.ops):
+                    todo_list.add_task(f"New task {i}")
+                elapsed = time.perf_counter() - start
+                start = time.perf_counter()
+                todo_list.close()
+                drain = time.perf_counter() - start
+                mode = "journal" if journal else "rewrite"
+                label = "write-behind" if write_behind else "sync"
+                print(f"{mode:8} {label:12} {args.ops / elapsed:10.1f} ops/s  "
+                      f"{elapsed / args.ops * 1e3:8.3f} ms/op  close {drain * 1e3:8.1f} ms")
+
+def bench_stress(args):
+    for threads in args.threads:
+        # A fresh directory each round so no journal carries over
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "todo.json")
+            write_tasks(filename, args.count)
+            todo_list = ThreadSafeTodoList(filename, journal=True, write_behind=True)
+            errors = []
+
+            def worker(n):
+                try:
+                    for i in range(args.ops):
+                        if i % 10 == 0:
+                            task = todo_list.add_task(f"Thread {n} task {i}", "", "2024-11-01")
+                            todo_list.complete_task_by_id(task.id)
+                        elif i % 10 == 1:
+                            todo_list.search(f"thread {n}")
+                        elif i % 10 == 2:
+                            todo_list.next_due(5, "2024-01-01")
+                        else:
+                            todo_list.get_tasks(include_completed=False)
+                except Exception as e:
+                    errors.append(e)
+
+            workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            todo_list.close()
+            if errors:
+                raise errors[0]
+            print(f"{threads:>3} threads  {threads * args.ops / elapsed:10.1f} ops/s")
+
+def contend(filename, journal, ops, n):
+    """One process's share of the contention benchmark"""
+    todo_list = TodoList(filename, journal=journal, lazy=True, durability="never")
+    for i in range(ops):
+        task = todo_list.add_task(f"Process {n} task {i}")
+        if i % 2:
+            todo_list.complete_task_by_id(task.id)
+
+def bench_contention(args):
+    for journal in (False, True):
+        for processes in args.processes:
+            with tempfile.TemporaryDirectory() as tmp:
+                filename = os.path.join(tmp, "todo.json")
+                write_tasks(filename, args.count)
+                workers = [multiprocessing.Process(target=contend,
+                                                   args=(filename, journal, args.ops, n))
+                           for n in range(processes)]
+                start = time.perf_counter()
+                for process in workers:
+                    process.start()
+                for process in workers:
+                    process.join()
+                elapsed = time.perf_counter() - start
+                if any(process.exitcode for process in workers):
+                    sys.exit("a contending process failed")
+                mode = "journal" if journal else "rewrite"
+                print(f"{mode:8} {processes:>3} processes  "
+                      f"{processes * args.ops * 2 / elapsed:9.1f} ops/s")
+
+def bench_http(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        write_tasks(filename, args.count)
+        # A separate process, so the clients don't compete with it for the GIL
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          "todo_server.py"),
+             "--file", filename, "--port", "0"],
+            stdout=subprocess.PIPE, text=True)
+        port = int(server.stdout.readline().rsplit(":", 1)[1])
+        latencies = {"list": [], "add": [], "batch": []}
+        errors = []
+
+        def client(n):
+            # One keep-alive connection per client
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            etag = None
+            try:
+                for i in range(args.requests):
+                    if i % 4 == 0:
+                        kind, method, path = "add", "POST", "/tasks"
+                        body = json.dumps({"title": f"Client {n} task {i}"})
+                    elif i % 4 == 1:
+                        kind, method, path = "batch", "POST", "/batch"
+                        body = json.dumps([{"op": "add", "title": f"Client {n} batch {i} #{j}"}
+                                           for j in range(10)])
+                    else:
+                        kind, method, path, body = "list", "GET", "/tasks?pending=1", None
+                    headers = {"Content-Type": "application/json"}
+                    if etag and kind == "list":
+                        headers["If-None-Match"] = etag
+                    start = time.perf_counter()
+                    conn.request(method, path, body, headers)
+                    response = conn.getresponse()
+                    response.read()
+                    latencies[kind].append(time.perf_counter() - start)
+                    if response.status >= 400:
+                        raise RuntimeError(f"{method} {path}: {response.status}")
+                    if kind == "list":
+                        etag = response.getheader("ETag")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                conn.close()
+
+        clients = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+        start = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server.send_signal(signal.SIGINT)
+        server.wait()
+        assert not errors, errors
+        added = args.clients * sum(10 if i % 4 == 1 else i % 4 == 0 for i in range(args.requests))
+        assert len(TodoList(filename, journal=True).tasks) == args.count + added
+        total = args.clients * args.requests
+        print(f"{args.clients} clients, {total} requests: {total / elapsed:.1f} req/s")
+        for kind, samples in latencies.items():
+            print(f"{kind:6} p50 {percentile(samples, 0.5) * 1e3:8.3f} ms  "
+                  f"p99 {percentile(samples, 0.99) * 1e3:8.3f} ms")
+
+def disk_usage(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def bench_backends(args):
+    backends = {
+        "memory": lambda tmp: MemoryBackend(),
+        "json": lambda tmp: JsonBackend(os.path.join(tmp, "todo.json")),
+        "sqlite": lambda tmp: SqliteBackend(os.path.join(tmp, "todo.db")),
+    }
+    tasks = [Task(f"Task {i}", "Description " * 5, "2024-10-31", completed=i % 3 == 0, id=i + 1)
+             for i in range(args.count)]
+    for name, make in backends.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = make(tmp)
+            backend.save(tasks)
+            start = time.perf_counter()
+            todo_list = TodoList(backend=backend)
+            load = time.perf_counter() - start
+            ids = list(todo_list.tasks_by_id)
+            start = time.perf_counter()
+            # The same mix for every backend: adds, completions, updates, deletes
+            for i in range(args.ops):
+                if i % 4 == 0:
+                    todo_list.add_task(f"New task {i}")
+                elif i % 4 == 1:
+                    todo_list.complete_task_by_id(ids[i % len(ids)])
+                elif i % 4 == 2:
+                    todo_list.update_task_by_id(ids[i % len(ids)], description="Changed")
+                else:
+                    todo_list.delete_task_by_id(ids[i % len(ids)])
+            ops = time.perf_counter() - start
+            start = time.perf_counter()
+            todo_list.save_tasks()
+            save = time.perf_counter() - start
+            expected = [task.to_dict() for task in todo_list.tasks]
+            todo_list.close()
+            # Memory can only be reopened by handing back the same backend
+            reopened = backend if name == "memory" else make(tmp)
+            assert [task.to_dict() for task in TodoList(backend=reopened).tasks] == expected
+            print(f"{name:7} load {load * 1e3:9.1f} ms  {args.ops / ops:10.1f} ops/s  "
+                  f"save {save * 1e3:9.1f} ms  on disk {disk_usage(tmp) / 2**20:7.2f} MiB")
+
+def bench_binary(args):
+    for count in args.counts:
+        tasks = [Task(f"Task {i}", "Description " * 5, "2024-10-31", completed=i % 3 == 0,
+                      id=i + 1)
+                 for i in range(count)]
+        expected = [task.to_dict() for task in tasks]
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, backend in (("json", JsonBackend(os.path.join(tmp, "todo.json"))),
+                                  ("binary", BinaryBackend(os.path.join(tmp, "todo.bin")))):
+                start = time.perf_counter()
+                backend.save(tasks)
+                save = time.perf_counter() - start
+                start = time.perf_counter()
+                loaded, _ = backend.load()
+                load = time.perf_counter() - start
+                assert [task.to_dict() for task in loaded] == expected
+                size = os.path.getsize(backend.filename)
+                print(f"{count:>9} tasks  {name:6}  save {save:7.2f} s  load {load:7.2f} s  "
+                      f"{size / 2**20:8.1f} MiB")
+
+def bench_archive(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        # Mostly history: old completed tasks, plus a few open ones
+        with open(filename, 'w') as f:
+            json.dump([
+                Task(f"Task {i}", "Description " * 5, "2024-10-31",
+                     completed=i % 10 != 0).to_dict() | {"created_date": "2023-01-01 09:00:00"}
+                for i in range(args.count)
+            ], f, indent=2)
+        todo_list = TodoList(filename)
+        for label in ("before", "after"):
+            if label == "after":
+                start = time.perf_counter()
+                moved = todo_list.archive(older_than=30)
+                print(f"archive: moved {moved} tasks in {time.perf_counter() - start:.2f} s")
+            start = time.perf_counter()
+            todo_list.save_tasks()
+            save = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(10):
+                todo_list.get_tasks(include_completed=False)
+            pending = (time.perf_counter() - start) / 10
+            start = time.perf_counter()
+            TodoList(filename)
+            load = time.perf_counter() - start
+            print(f"{label:6}  todo.json {os.path.getsize(filename) / 2**20:6.1f} MiB  "
+                  f"load {load * 1e3:8.1f} ms  save {save * 1e3:8.1f} ms  "
+                  f"pending query {pending * 1e3:7.2f} ms")
+        start = time.perf_counter()
+        found = todo_list.search_archive("task")
+        print(f"archive search: {len(found)} hits in {time.perf_counter() - start:.2f} s "
+              "(first search loads the archive)")
+        todo_list.close()
+
+WORDS = ("buy", "call", "email", "fix", "review", "plan", "book", "pay", "write", "read",
+         "clean", "update", "send", "check", "prepare", "order", "renew", "schedule",
+         "groceries", "dentist", "report", "invoice", "car", "insurance", "taxes", "garden",
+         "meeting", "slides", "budget", "flights", "hotel", "birthday", "present", "bug",
+         "release", "docs", "kitchen", "laundry", "bank", "passport", "mum", "team", "client",
+         "contract", "backup", "laptop", "gym", "library", "the", "for", "with", "before")
+
+def generate_tasks(count, seed=0):
+    """Synthetic tasks shaped like a real list: titles of a few words, a
+    description on most, created dates over two years, due dates on some and
+    about a third completed. The same seed always gives the same tasks."""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    first_due = date(2023, 1, 1).toordinal()
+    tasks = []
+    for i in range(count):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize()
+        description = ""
+        if rng.random() < 0.7:
+            description = " ".join(rng.choices(WORDS, k=rng.randint(4, 30)))
+        due_date = None
+        if rng.random() < 0.6:
+            due_date = date.fromordinal(first_due + rng.randrange(1000)).isoformat()
+        task = Task(title, description, due_date, completed=rng.random() < 0.35, id=i + 1)
+        task.created_date = str(start + timedelta(seconds=rng.randrange(730 * 86400)))
+        tasks.append(task)
+    return tasks
+
+def time_calls(func, calls, first=0):
+    """Latency in seconds of each of calls calls to func(i), i counting from first"""
+    latencies = []
+    for i in range(first, first + calls):
+        start = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def suite_result(size, operation, latencies, peak_bytes):
+    total = sum(latencies)
+    return {
+        "size": size,
+        "operation": operation,
+        "samples": len(latencies),
+        "ops_per_sec": len(latencies) / total if total else None,
+        "p50_ms": percentile(latencies, 0.5) * 1e3,
+        "p90_ms": percentile(latencies, 0.9) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "max_ms": max(latencies) * 1e3,
+        "peak_bytes": peak_bytes,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare_results(results, baseline, tolerance):
+    """Print (size, operation) pairs whose p50 got more than tolerance slower
+    than in baseline; returns how many did"""
+    before = {(r["size"], r["operation"]): r for r in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = before.get((result["size"], result["operation"]))
+        if old is None:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0
+        if change > tolerance:
+            regressions += 1
+            print(f"REGRESSION {result['operation']:19} {result['size']:>9} tasks  "
+                  f"p50 {old['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms ({change:+.0%})")
+    return regressions
+
+def bench_suite(args):
+    # durability="never" keeps fsync out of the numbers, which measure the
+    # library rather than the disk
+    options = {"journal": args.mode == "journal", "durability": "never"}
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "todo.json")
+            with open(filename, 'w') as f:
+                json.dump([task.to_dict() for task in generate_tasks(size, args.seed)], f,
+                          indent=2)
+            rng = random.Random(args.seed)
+            measured = []
+
+            def run(operation, func, calls):
+                latencies = time_calls(func, calls)
+                peak_bytes = None
+                if args.memory:
+                    # A separate, shorter pass: tracing would skew the timings
+                    _, peak_bytes = peak(lambda: time_calls(func, min(calls, 3), calls))
+                measured.append(suite_result(size, operation, latencies, peak_bytes))
+
+            run("load_tasks", lambda i: TodoList(filename, **options), args.repeat)
+            todo_list = TodoList(filename, **options)
+            run("add_task", lambda i: todo_list.add_task(f"Benchmark task {i}", "Added by the suite",
+                                                         "2024-12-31"), args.ops)
+            # Targets are picked up front so only the call itself is timed.
+            # Two rounds of deletes follow, and every position stays in range
+            # after both; the extra picks are for the memory pass.
+            picks = args.ops + 3
+            count = len(todo_list.tasks_by_id)
+            positions = [rng.randrange(max(1, count - 2 * picks)) for _ in range(picks)]
+            ids = rng.sample(list(todo_list.tasks_by_id), min(count, picks))
+            run("complete_task", lambda i: todo_list.complete_task(positions[i]), args.ops)
+            run("complete_task_by_id",
+                lambda i: todo_list.complete_task_by_id(ids[i % len(ids)]), args.ops)
+            run("update_task", lambda i: todo_list.update_task(positions[i],
+                                                               description=f"Edited {i}"),
+                args.ops)
+            run("update_task_by_id",
+                lambda i: todo_list.update_task_by_id(ids[i % len(ids)], description=f"Edited {i}"),
+                args.ops)
+            run("delete_task_by_id",
+                lambda i: todo_list.delete_task_by_id(ids[i % len(ids)]), args.ops)
+            run("delete_task", lambda i: todo_list.delete_task(positions[i]), args.ops)
+            run("get_tasks_pending", lambda i: todo_list.get_tasks(include_completed=False),
+                args.repeat)
+            run("save_tasks", lambda i: todo_list.save_tasks(), args.repeat)
+            todo_list.close()
+            for result in measured:
+                peak_text = ("" if result["peak_bytes"] is None
+                             else f"  peak {result['peak_bytes'] / 2**20:8.1f} MiB")
+                print(f"{size:>9} tasks  {result['operation']:19} "
+                      f"{result['ops_per_sec']:11.1f} ops/s  p50 {result['p50_ms']:9.3f} ms  "
+                      f"p99 {result['p99_ms']:9.3f} ms{peak_text}", flush=True)
+            results.extend(measured)
+    report = {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": args.mode,
+            "seed": args.seed,
+            "ops": args.ops,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        print(f"{regressions} regression(s) against {args.compare}")
+        return 1 if regressions else 0
+
+def bench_table(args):
+    tasks = generate_tasks(args.count, args.seed)
+    todo_list = TodoList(lazy=True)
+    todo_list._set_tasks(tasks)
+
+    def objects():
+        # The same reports the way they'd be written against Task objects
+        weeks, months = {}, {}
+        for task in todo_list.tasks:
+            if not task.completed and isinstance(task.due, int):
+                day = date.fromordinal(task.due)
+                week = (day - timedelta(days=day.weekday())).isoformat()
+                weeks[week] = weeks.get(week, 0) + 1
+            month = months.setdefault(task.created_date[:7], [0, 0])
+            month[0] += 1
+            month[1] += task.completed
+        return weeks, {key: done / total for key, (total, done) in months.items()}
+
+    def columnar(table):
+        return (table.counts_by_due_week(completed=False),
+                table.completion_rate_by_created_month())
+
+    start = time.perf_counter()
+    table = todo_list.table()
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = objects()
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    weeks, months = columnar(table)
+    vectorized = time.perf_counter() - start
+    assert weeks == dict(sorted(expected[0].items()))
+    assert months.keys() == expected[1].keys()
+    assert all(math.isclose(months[month], rate) for month, rate in expected[1].items())
+    engine = "numpy" if todo.load_numpy() is not None else "plain Python"
+    print(f"{args.count} tasks  build table {build:6.2f} s  Task loop {loop:6.2f} s  "
+          f"TaskTable ({engine}) {vectorized:6.2f} s")
+
+def bench_async(args):
+    """Longest event-loop stall while AsyncTodoList mutates and reads a big list"""
+    import asyncio
+
+    async def run(filename):
+        stall = 0.0
+        done = False
+
+        async def ticker():
+            nonlocal stall
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                stall = max(stall, now - last)
+                last = now
+
+        async with todo.AsyncTodoList(filename) as todo_list:
+            watch = asyncio.create_task(ticker())
+            start = time.perf_counter()
+            calls = [todo_list.add_task(f"New {i}") for i in range(args.ops)]
+            calls += [todo_list.get_task(1) for _ in range(args.ops)]
+            await asyncio.gather(*calls)
+            elapsed = time.perf_counter() - start
+            done = True
+            await watch
+        return elapsed, stall
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "todo.json")
+        write_tasks(filename, args.count)
+        elapsed, stall = asyncio.run(run(filename))
+    print(f"{args.count} tasks  {2 * args.ops} calls in {elapsed:6.2f} s  "
+          f"longest loop stall {stall * 1e3:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="TodoList benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    memory = commands.add_parser("memory", help="per-task memory and construction cost")
+    memory.add_argument("--count", type=int, default=200_000)
+    memory.set_defaults(func=bench_memory)
+    stream = commands.add_parser("stream", help="peak memory of a pending-count query")
+    stream.add_argument("--counts", type=int, nargs="+", default=[10_000, 100_000])
+    stream.set_defaults(func=bench_stream)
+    coldstart = commands.add_parser("coldstart", help="open a list and read its counts")
+    coldstart.add_argument("--counts", type=int, nargs="+", default=[10_000, 100_000])
+    coldstart.set_defaults(func=bench_coldstart)
+    durability = commands.add_parser("durability", help="mutation cost of each fsync policy")
+    durability.add_argument("--count", type=int, default=10_000, help="tasks in the list")
+    durability.add_argument("--ops", type=int, default=200, help="mutations to time")
+    durability.set_defaults(func=bench_durability)
+    write_behind = commands.add_parser("writebehind", help="sync vs write-behind mutations")
+    write_behind.add_argument("--count", type=int, default=10_000, help="tasks in the list")
+    write_behind.add_argument("--ops", type=int, default=200, help="mutations to time")
+    write_behind.set_defaults(func=bench_write_behind)
+    stress = commands.add_parser("stress", help="mixed reads and writes from many threads")
+    stress.add_argument("--count", type=int, default=2_000, help="tasks in the list")
+    stress.add_argument("--ops", type=int, default=500, help="operations per thread")
+    stress.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    stress.set_defaults(func=bench_stress)
+    contention = commands.add_parser("contention", help="several processes writing one file")
+    contention.add_argument("--count", type=int, default=1_000, help="tasks in the list")
+    contention.add_argument("--ops", type=int, default=100, help="tasks each process adds")
+    contention.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    contention.set_defaults(func=bench_contention)
+    http_bench = commands.add_parser("http", help="load-test the HTTP service on localhost")
+    http_bench.add_argument("--count", type=int, default=1_000, help="tasks in the list")
+    http_bench.add_argument("--clients", type=int, default=8, help="concurrent connections")
+    http_bench.add_argument("--requests", type=int, default=200, help="requests per client")
+    http_bench.set_defaults(func=bench_http)
+    backends = commands.add_parser("backends", help="one workload against each storage backend")
+    backends.add_argument("--count", type=int, default=100_000, help="tasks in the list")
+    backends.add_argument("--ops", type=int, default=2_000, help="mutations to time")
+    backends.set_defaults(func=bench_backends)
+    binary = commands.add_parser("binary", help="JSON vs binary snapshot save, load and size")
+    binary.add_argument("--counts", type=int, nargs="+", default=[100_000, 1_000_000])
+    binary.set_defaults(func=bench_binary)
+    archive = commands.add_parser("archive", help="active list size and speed before/after archiving")
+    archive.add_argument("--count", type=int, default=100_000, help="tasks in the list")
+    archive.set_defaults(func=bench_archive)
+    suite = commands.add_parser("suite", help="time every core operation at several list sizes")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    suite.add_argument("--ops", type=int, default=200, help="calls of each mutation to time")
+    suite.add_argument("--repeat", type=int, default=3, help="calls of load, save and get_tasks")
+    suite.add_argument("--mode", choices=["journal", "rewrite"], default="journal")
+    suite.add_argument("--seed", type=int, default=0, help="seed for the generated tasks")
+    suite.add_argument("--no-memory", dest="memory", action="store_false",
+                       help="skip the traced peak-memory passes")
+    suite.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    suite.add_argument("--compare", metavar="PATH",
+                       help="exit 1 if any p50 is slower than in this earlier --json file")
+    suite.add_argument("--tolerance", type=float, default=0.25,
+                       help="allowed p50 slowdown for --compare (default: 0.25)")
+    suite.set_defaults(func=bench_suite)
+    table = commands.add_parser("table", help="reports over Task objects vs a TaskTable")
+    table.add_argument("--count", type=int, default=1_000_000, help="tasks in the list")
+    table.add_argument("--seed", type=int, default=0, help="seed for the generated tasks")
+    table.set_defaults(func=bench_table)
+    async_bench = commands.add_parser("async", help="event-loop stalls under AsyncTodoList")
+    async_bench.add_argument("--count", type=int, default=200_000, help="tasks in the list")
+    async_bench.add_argument("--ops", type=int, default=20, help="mutations and reads to run")
+    async_bench.set_defaults(func=bench_async)
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
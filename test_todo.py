@@ -0,0 +1,342 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+import todo
+from todo import (BinaryBackend, JsonBackend, SqliteBackend, SqliteTodoList, Task,
+                  ThreadSafeTodoList, TodoList)
+
+def write_tasks(filename, count):
+    """Save count tasks, a third of them completed, as a todo.json"""
+    JsonBackend(filename).save([Task(f"Task {i}", "", "2024-10-31", completed=i % 3 == 0,
+                                     id=i + 1)
+                                for i in range(count)])
+
+def interrupted_save(todo_list, log_filename):
+    """save_tasks() as if the process died after the new snapshot was in
+    place but before the old log was removed"""
+    with open(log_filename, 'r') as f:
+        log = f.read()
+    todo_list.save_tasks()
+    with open(log_filename, 'w') as f:
+        f.write(log)
+
+def contend(filename, journal, ops, n):
+    """One process's share of ConcurrencyTest.test_processes"""
+    todo_list = TodoList(filename, journal=journal, lazy=True, durability="never")
+    for i in range(ops):
+        task = todo_list.add_task(f"Process {n} task {i}")
+        if i % 2:
+            todo_list.complete_task_by_id(task.id)
+
+class TempDirTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+class CrashTest(TempDirTest):
+    """Reopening files left behind by interrupted writes applies nothing
+    twice and loses nothing"""
+
+    BACKENDS = {
+        "json": lambda path: JsonBackend(path("todo.json")),
+        "binary": lambda path: BinaryBackend(path("todo.bin")),
+    }
+
+    def test_interrupted_save_with_adds(self):
+        for name, make in self.BACKENDS.items():
+            with self.subTest(name):
+                self.setUp()
+                todo_list = TodoList(backend=make(self.path))
+                todo_list.add_task("First")
+                todo_list.add_task("Second")
+                interrupted_save(todo_list, make(self.path).log_filename)
+                reopened = TodoList(backend=make(self.path))
+                self.assertEqual([task.title for task in reopened.tasks], ["First", "Second"])
+                self.assertEqual(reopened.counts()["total"], 2)
+                # The stale log is gone, so later appends replay normally
+                reopened.add_task("Third")
+                self.assertEqual([task.title for task in TodoList(backend=make(self.path)).tasks],
+                                 ["First", "Second", "Third"])
+
+    def test_interrupted_save_with_changes_to_deleted_task(self):
+        for name, make in self.BACKENDS.items():
+            with self.subTest(name):
+                self.setUp()
+                todo_list = TodoList(backend=make(self.path))
+                task = todo_list.add_task("Doomed")
+                todo_list.save_tasks()
+                todo_list.complete_task_by_id(task.id)
+                todo_list.delete_task_by_id(task.id)
+                interrupted_save(todo_list, make(self.path).log_filename)
+                self.assertEqual(TodoList(backend=make(self.path)).tasks, [])
+
+    def test_interrupted_compaction(self):
+        filename = self.path("todo.json")
+        todo_list = TodoList(filename, journal=True)
+        for i in range(100):
+            todo_list.add_task(f"Task {i}")
+        todo_list.complete_task_by_id(1)
+        # The log was rotated, but the new snapshot never written
+        os.replace(filename + ".log", filename + ".log.1")
+        reopened = TodoList(filename, journal=True)
+        self.assertEqual([task.to_dict() for task in reopened.tasks],
+                         [task.to_dict() for task in todo_list.tasks])
+        self.assertFalse(os.path.exists(filename + ".log.1"))
+
+    def test_sqlite_empty_update(self):
+        todo_list = TodoList(backend=SqliteBackend(self.path("todo.db")))
+        task = todo_list.add_task("Kept", "As is")
+        self.assertTrue(todo_list.update_task_by_id(task.id))
+        todo_list.close()
+        reopened = TodoList(backend=SqliteBackend(self.path("todo.db")))
+        self.assertEqual([task.to_dict() for task in reopened.tasks], [task.to_dict()])
+        reopened.close()
+
+class BatchTest(TempDirTest):
+    def test_rollback_undoes_every_change(self):
+        todo_list = TodoList(self.path("todo.json"), persist_index=True)
+        for i in range(10):
+            todo_list.add_task(f"Task {i}", "", f"2024-01-{i + 1:02d}")
+        todo_list.complete_task_by_id(2)
+
+        def state():
+            return ({task.id: task.to_dict() for task in todo_list.tasks}, todo_list.counts(),
+                    [task.id for task in todo_list.search("task")],
+                    [task.id for task in todo_list.next_due(10, "2024-01-01")],
+                    todo_list.next_id)
+
+        before = state()
+        with self.assertRaises(RuntimeError):
+            with todo_list.batch():
+                todo_list.add_task("Added", "", "2024-01-05")
+                todo_list.complete_task_by_id(3)
+                todo_list.update_task_by_id(4, title="Renamed", due_date="2025-01-01")
+                todo_list.update_task_by_id(5, title="Renamed, then deleted")
+                todo_list.delete_tasks([5, 6])
+                added = todo_list.add_task("Added, then deleted")
+                todo_list.delete_task_by_id(added.id)
+                raise RuntimeError
+        self.assertEqual(state(), before)
+        # Nothing from the failed batch was saved
+        reopened = TodoList(self.path("todo.json"))
+        self.assertEqual({task.id: task.to_dict() for task in reopened.tasks}, before[0])
+
+class IdsTest(TempDirTest):
+    """Ids of deleted tasks are never handed out again, whichever way the
+    list is stored"""
+
+    LAYOUTS = {
+        "rewrite": lambda path: TodoList(path("todo.json")),
+        "journal": lambda path: TodoList(path("todo.json"), journal=True),
+        "json": lambda path: TodoList(backend=JsonBackend(path("todo.json"))),
+        "binary": lambda path: TodoList(backend=BinaryBackend(path("todo.bin"))),
+        "sqlite": lambda path: TodoList(backend=SqliteBackend(path("todo.db"))),
+        "sqlitelist": lambda path: SqliteTodoList(path("todo.db")),
+    }
+
+    def test_deleted_ids_stay_used(self):
+        for name, make in self.LAYOUTS.items():
+            for compact in (False, True):
+                with self.subTest(name, compact=compact):
+                    self.setUp()
+                    todo_list = make(self.path)
+                    for i in range(5):
+                        todo_list.add_task(f"Task {i}")
+                    todo_list.delete_task_by_id(5)
+                    todo_list.delete_task_by_id(4)
+                    if compact and hasattr(todo_list, "compact"):
+                        todo_list.compact()
+                    todo_list.save_tasks()
+                    todo_list.close()
+                    reopened = make(self.path)
+                    self.assertEqual(reopened.add_task("Next").id, 6)
+                    reopened.close()
+
+class ArchiveTest(TempDirTest):
+    """A task left in both lists by a crash is deduplicated, not copied"""
+
+    def make(self):
+        todo_list = TodoList(self.path("todo.json"))
+        for i in range(3):
+            todo_list.add_task(f"Task {i}")
+            todo_list.complete_task_by_id(i + 1)
+        return todo_list
+
+    def test_archive_after_crash(self):
+        todo_list = self.make()
+        # Archived, but the crash came before they left the active list
+        todo_list.archive_list.insert_tasks(
+            Task.from_dict(task.to_dict()) for task in todo_list.tasks)
+        self.assertEqual(todo_list.archive(older_than=0, now="2100-01-01"), 3)
+        self.assertEqual(todo_list.tasks, [])
+        self.assertEqual([task.id for task in todo_list.archived_tasks()], [1, 2, 3])
+
+    def test_restore_after_crash(self):
+        todo_list = self.make()
+        todo_list.archive(older_than=0, now="2100-01-01")
+        # Restored, but the crash came before they left the archive
+        todo_list.insert_tasks(
+            Task.from_dict(task.to_dict()) for task in todo_list.archived_tasks())
+        restored = todo_list.restore([1, 2, 3])
+        self.assertEqual([task.id for task in restored], [1, 2, 3])
+        self.assertEqual([task.id for task in todo_list.tasks], [1, 2, 3])
+        self.assertEqual(todo_list.archived_tasks(), [])
+
+    def test_archive_next_to_backend_file(self):
+        todo_list = TodoList(backend=SqliteBackend(self.path("todo.db")))
+        todo_list.add_task("Done")
+        todo_list.complete_task_by_id(1)
+        todo_list.archive(older_than=0, now="2100-01-01")
+        self.assertEqual(todo_list.archive_filename, self.path("todo.db.archive"))
+        todo_list.close()
+        archived = TodoList(self.path("todo.db.archive"), journal=True).tasks
+        self.assertEqual([task.title for task in archived], ["Done"])
+
+class DurabilityTest(TempDirTest):
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc to name synced files")
+    def test_periodic_syncs_snapshot_before_rename(self):
+        filename = self.path("todo.json")
+        todo_list = TodoList(filename, fsync_interval=3600)
+        synced = []
+        fsync = todo.os.fsync
+
+        def record(fd):
+            synced.append(os.path.basename(os.readlink(f"/proc/self/fd/{fd}")))
+            fsync(fd)
+
+        todo.os.fsync = record
+        self.addCleanup(setattr, todo.os, "fsync", fsync)
+        todo_list.add_task("First")
+        todo_list.add_task("Within the interval")
+        # Both snapshots' contents were synced before they replaced todo.json
+        snapshots = [name for name in synced if name.endswith(".tmp")]
+        self.assertEqual(len(snapshots), 2)
+        # The second rename waits for the interval
+        self.assertIn(filename, todo_list._unsynced)
+        todo_list.close()
+        self.assertEqual(todo_list._unsynced, set())
+
+class StatsTest(TempDirTest):
+    def test_queries_timed_where_they_run(self):
+        todo_list = TodoList(self.path("todo.json"), instrument=True)
+        for i in range(20):
+            todo_list.add_task(f"Task {i}")
+        todo_list.query().where(completed=False).all()
+        todo_list.query().first()
+        todo_list.query().count()
+        query = todo_list.stats()["operations"]["query"]
+        self.assertEqual(query["calls"], 3)
+        self.assertEqual(query["errors"], 0)
+
+    def test_bytes_read_where_files_are_read(self):
+        filename = self.path("todo.json")
+        write_tasks(filename, 100)
+        TodoList(filename).save_tasks()
+        todo_list = TodoList(filename, lazy=True, instrument=True)
+        todo_list.counts()
+        self.assertEqual(todo_list.stats()["bytes_read"], os.path.getsize(filename + ".meta"))
+        list(todo_list.iter_tasks_from_file())
+        self.assertEqual(todo_list.stats()["bytes_read"],
+                         os.path.getsize(filename + ".meta") + os.path.getsize(filename))
+
+class UnloadedAddTest(TempDirTest):
+    """A lazy journal-mode add appends without loading the list"""
+
+    def lazy(self):
+        return TodoList(self.path("todo.json"), journal=True, lazy=True)
+
+    def test_ids_follow_snapshot_and_journal(self):
+        todo_list = TodoList(self.path("todo.json"), journal=True)
+        for i in range(5):
+            todo_list.add_task(f"Task {i}")
+        todo_list.compact()
+        todo_list.delete_task_by_id(5)
+        todo_list.add_task("Journaled")
+        todo_list.delete_task_by_id(6)
+        first, second = self.lazy(), self.lazy()
+        self.assertEqual(first.add_task("Lazy").id, 7)
+        self.assertEqual(second.add_task("Another process").id, 8)
+        self.assertFalse(first.loaded or second.loaded)
+        self.assertEqual([task.id for task in TodoList(self.path("todo.json")).tasks],
+                         [1, 2, 3, 4, 7, 8])
+
+    def test_new_file(self):
+        todo_list = self.lazy()
+        self.assertEqual(todo_list.add_task("First").id, 1)
+        self.assertFalse(todo_list.loaded)
+        self.assertEqual(self.lazy().add_task("Second").id, 2)
+
+    def test_loads_without_matching_sidecar(self):
+        write_tasks(self.path("todo.json"), 3)
+        todo_list = self.lazy()
+        self.assertEqual(todo_list.add_task("Fourth").id, 4)
+        self.assertTrue(todo_list.loaded)
+
+class ConcurrencyTest(TempDirTest):
+    """Nothing is lost however threads' and processes' writes interleave"""
+
+    def test_threads(self):
+        filename = self.path("todo.json")
+        write_tasks(filename, 200)
+        todo_list = ThreadSafeTodoList(filename, journal=True, write_behind=True)
+        errors = []
+        added = [0] * 4
+
+        def worker(n):
+            try:
+                for i in range(100):
+                    if i % 10 == 0:
+                        task = todo_list.add_task(f"Thread {n} task {i}", "", "2024-11-01")
+                        added[n] += 1
+                        todo_list.complete_task_by_id(task.id)
+                    elif i % 10 == 1:
+                        todo_list.search(f"thread {n}")
+                    elif i % 10 == 2:
+                        todo_list.next_due(5, "2024-01-01")
+                    else:
+                        todo_list.get_tasks(include_completed=False)
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(len(added))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        todo_list.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(todo_list.tasks), 200 + sum(added))
+        reloaded = TodoList(filename, journal=True)
+        self.assertEqual([task.to_dict() for task in reloaded.tasks],
+                         [task.to_dict() for task in todo_list.tasks])
+
+    def test_processes(self):
+        processes, ops = 3, 20
+        for journal in (False, True):
+            with self.subTest(journal=journal):
+                self.setUp()
+                filename = self.path("todo.json")
+                write_tasks(filename, 100)
+                workers = [multiprocessing.Process(target=contend,
+                                                   args=(filename, journal, ops, n))
+                           for n in range(processes)]
+                for process in workers:
+                    process.start()
+                for process in workers:
+                    process.join()
+                self.assertEqual([process.exitcode for process in workers], [0] * processes)
+                tasks = TodoList(filename, journal=journal).tasks
+                added = [task for task in tasks if task.title.startswith("Process ")]
+                self.assertEqual(len(tasks), 100 + processes * ops)
+                self.assertEqual(len({task.title for task in added}), processes * ops)
+                self.assertEqual(sum(task.completed for task in added), processes * (ops // 2))
+
+if __name__ == "__main__":
+    unittest.main()
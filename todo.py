@@ -1,17 +1,131 @@
+import argparse
+import atexit
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import gc
+import heapq
 import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager, nullcontext
+from itertools import accumulate, islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves still merge, but without a lock
+    fcntl = None
+
+# NumPy, once load_numpy() has looked for it; None if it isn't installed
+_numpy = False
+
+# Journal size at which mutations are folded back into the snapshot
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# When writes are fsynced: on every write, at most once per fsync_interval
+# seconds (a write in between is synced when the interval is up), or never
+# (left to the OS). "periodic" still syncs a new snapshot's contents before
+# renaming it into place, as a lost snapshot loses the whole list; only the
+# rename and journal appends wait for the interval.
+DURABILITY_POLICIES = ("always", "periodic", "never")
+
+# Upper bounds, in seconds, of the stats() latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# TodoList methods timed when instrument=True; queries are timed as "query"
+# while they run (see Query.__iter__)
+INSTRUMENTED_METHODS = (
+    "load_tasks", "save_tasks", "compact", "refresh", "flush", "counts",
+    "add_task", "add_tasks", "insert_tasks", "complete_task", "complete_task_by_id",
+    "complete_tasks", "delete_task", "delete_task_by_id", "delete_tasks", "update_task",
+    "update_task_by_id", "archive", "restore", "get_task", "get_tasks", "tasks_due_between",
+    "overdue", "next_due", "undated_tasks", "search", "archived_tasks", "search_archive",
+    "page", "table",
+)
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+TOKEN = re.compile(r"\w+")
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+def load_numpy():
+    """NumPy, or None without it. Only TaskTable uses it, so it is imported
+    on first use rather than slowing down every import of this module."""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:  # TaskTable then filters and aggregates in plain loops
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+def datetime_to_seconds(dt):
+    """Seconds since 1970-01-01 for a naive local datetime"""
+    return ((dt.toordinal() - EPOCH_ORDINAL) * 86400
+            + dt.hour * 3600 + dt.minute * 60 + dt.second)
+
+def parse_created(text):
+    """'YYYY-MM-DD HH:MM:SS' -> seconds, or the text itself if it isn't in that format"""
+    try:
+        dt = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return text
+    return datetime_to_seconds(dt) if str(dt) == text else text
+
+def parse_due(text):
+    """'YYYY-MM-DD' -> ordinal day, or the text itself if it isn't in that format"""
+    if text is None:
+        return None
+    try:
+        day = date.fromisoformat(text)
+    except (TypeError, ValueError):
+        return text
+    return day.toordinal() if day.isoformat() == text else text
 
 class Task:
-    def __init__(self, title, description="", due_date=None, completed=False):
+    # Dates are held as integers (seconds / ordinal days) and only formatted
+    # when they are read back as strings or serialized.
+    __slots__ = ("id", "title", "description", "created", "due", "completed")
+
+    def __init__(self, title, description="", due_date=None, completed=False, id=None):
+        self.id = id
         self.title = title
         self.description = description
-        self.created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.due_date = due_date
+        self.created = datetime_to_seconds(datetime.now())
+        self.due = parse_due(due_date)
         self.completed = completed
 
+    @property
+    def created_date(self):
+        if isinstance(self.created, int):
+            return str(EPOCH + timedelta(seconds=self.created))
+        return self.created
+
+    @created_date.setter
+    def created_date(self, value):
+        self.created = parse_created(value)
+
+    @property
+    def due_date(self):
+        if isinstance(self.due, int):
+            return date.fromordinal(self.due).isoformat()
+        return self.due
+
+    @due_date.setter
+    def due_date(self, value):
+        self.due = parse_due(value)
+
     def to_dict(self):
         return {
+            "id": self.id,
             "title": self.title,
             "description": self.description,
             "created_date": self.created_date,
@@ -21,81 +135,3071 @@ class Task:
 
     @classmethod
     def from_dict(cls, data):
-        task = cls(data["title"], data["description"], data["due_date"])
-        task.created_date = data["created_date"]
+        task = cls.__new__(cls)
+        task.id = data.get("id")
+        task.title = data["title"]
+        task.description = data["description"]
+        task.created = parse_created(data["created_date"])
+        task.due = parse_due(data["due_date"])
         task.completed = data["completed"]
         return task
 
-class TodoList:
-    def __init__(self, filename="todo.json"):
+def fsync_directory(path):
+    """Make a rename inside path's directory durable, where the OS allows it"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def fsync_file(path):
+    """fsync a file that was written earlier, and the rename that put it
+    there; a file removed since is skipped"""
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    fsync_directory(path)
+
+def bytes_read(f):
+    """Bytes read from disk so far through an open file, in any mode,
+    counting read-ahead rather than just what has been parsed"""
+    return getattr(f, "buffer", f).raw.tell()
+
+def atomic_write(path, write, sync=False, mode='w', sync_rename=None):
+    """Write a file through a temp file in the same directory, then rename it
+    over path so readers see either the old or the new contents, never a mix.
+    sync fsyncs the contents before the rename, and sync_rename (default:
+    sync) the directory after it."""
+    if sync_rename is None:
+        sync_rename = sync
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode) as f:
+            write(f)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if sync_rename:
+        fsync_directory(path)
+
+def file_signature(path):
+    """[inode, size, mtime] of a file, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+def entry_fields(entry):
+    """Field changes made by a journaled complete/update entry"""
+    if entry["op"] == "complete":
+        return {"completed": True}
+    return {field: entry[field] for field in ("title", "description", "due_date")
+            if field in entry}
+
+SQLITE_COLUMNS = "id, title, description, created_date, due_date, completed"
+SQLITE_INSERT = f"INSERT INTO tasks ({SQLITE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)"
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    created_date TEXT NOT NULL,
+    due_date TEXT,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed);
+CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+CREATE INDEX IF NOT EXISTS tasks_created_date ON tasks (created_date);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def sqlite_next_id(conn):
+    """The lowest id never handed out: past every row and past the saved
+    high-water mark, which remembers ids whose rows have been deleted"""
+    saved = conn.execute("SELECT value FROM settings WHERE key = 'next_id'").fetchone()
+    highest = conn.execute("SELECT MAX(id) FROM tasks").fetchone()[0]
+    return max(saved[0] if saved else 1, (highest or 0) + 1)
+
+def sqlite_keep_next_id(conn, next_id):
+    """Raise the saved high-water mark to next_id; it never goes down"""
+    conn.execute("INSERT INTO settings (key, value) VALUES ('next_id', ?) "
+                 "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+                 (next_id,))
+
+def task_row(task):
+    """A Task as a row of SQLITE_COLUMNS"""
+    return (task.id, task.title, task.description, task.created_date, task.due_date,
+            int(task.completed))
+
+def task_from_row(row):
+    return Task.from_dict({
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "created_date": row[3],
+        "due_date": row[4],
+        "completed": bool(row[5])
+    })
+
+def tokenize(text):
+    """Lower-cased words of a piece of text"""
+    return TOKEN.findall(text.lower()) if text else []
+
+class SearchIndex:
+    """Inverted index from words in task titles/descriptions to task ids"""
+
+    def __init__(self, postings=None):
+        self.postings = postings if postings is not None else {}
+        # Sorted vocabulary for prefix lookups, rebuilt when words come or go
+        self._vocabulary = None
+
+    @staticmethod
+    def task_tokens(task):
+        return set(tokenize(task.title)) | set(tokenize(task.description))
+
+    def add(self, task):
+        for token in self.task_tokens(task):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                self._vocabulary = None
+            ids.add(task.id)
+
+    def remove(self, task):
+        for token in self.task_tokens(task):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(task.id)
+                if not ids:
+                    del self.postings[token]
+                    self._vocabulary = None
+
+    def rebuild(self, tasks):
+        self.postings = {}
+        self._vocabulary = None
+        for task in tasks:
+            self.add(task)
+
+    def _prefixed(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        ids = set()
+        for i in range(bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            token = self._vocabulary[i]
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query):
+        """Return ids matching query.
+
+        Terms are ANDed, "OR" separates alternatives and a trailing "*"
+        makes a term match as a prefix, e.g. "milk OR bread* shop".
+        """
+        result = set()
+        for clause in re.split(r"\s+OR\s+", query.strip()):
+            ids = None
+            for term in clause.split():
+                words = tokenize(term)
+                for i, word in enumerate(words):
+                    if term.endswith("*") and i == len(words) - 1:
+                        matches = self._prefixed(word)
+                    else:
+                        matches = self.postings.get(word, set())
+                    ids = set(matches) if ids is None else ids & matches
+            if ids:
+                result |= ids
+        return result
+
+def to_day(value):
+    """Ordinal day for a date or a 'YYYY-MM-DD' string"""
+    if isinstance(value, date):
+        return value.toordinal()
+    day = parse_due(value)
+    if not isinstance(day, int):
+        raise ValueError(f"expected a YYYY-MM-DD date, got {value!r}")
+    return day
+
+class DueIndex:
+    """Pending tasks ordered by due date.
+
+    Dated tasks live in a sorted list of (ordinal day, id) pairs; tasks with
+    no due date, or one that isn't YYYY-MM-DD, are kept in a separate set.
+    Completed tasks are left out.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.undated = set()
+
+    def add(self, task):
+        if task.completed:
+            return
+        if isinstance(task.due, int):
+            insort(self.entries, (task.due, task.id))
+        else:
+            self.undated.add(task.id)
+
+    def remove(self, task):
+        if isinstance(task.due, int):
+            key = (task.due, task.id)
+            i = bisect_left(self.entries, key)
+            if i < len(self.entries) and self.entries[i] == key:
+                del self.entries[i]
+        else:
+            self.undated.discard(task.id)
+
+    def rebuild(self, tasks):
+        self.entries = sorted((task.due, task.id) for task in tasks
+                              if not task.completed and isinstance(task.due, int))
+        self.undated = {task.id for task in tasks
+                        if not task.completed and not isinstance(task.due, int)}
+
+    def between(self, start_day, end_day):
+        """Ids due within [start_day, end_day], earliest first"""
+        lo = bisect_left(self.entries, (start_day,))
+        hi = bisect_left(self.entries, (end_day + 1,))
+        return [task_id for _, task_id in self.entries[lo:hi]]
+
+    def before(self, day):
+        """Ids due strictly before day, earliest first"""
+        hi = bisect_left(self.entries, (day,))
+        return [task_id for _, task_id in self.entries[:hi]]
+
+    def first_from(self, day, k):
+        """The first k ids due on or after day"""
+        lo = bisect_left(self.entries, (day,))
+        return [task_id for _, task_id in self.entries[lo:lo + k]]
+
+class IdIndex:
+    """Task ids in ascending order, for paging by id"""
+
+    def __init__(self):
+        self.ids = []
+
+    def add(self, task):
+        # New tasks get the highest id so far; only restored ones go in between
+        if not self.ids or task.id > self.ids[-1]:
+            self.ids.append(task.id)
+        else:
+            insort(self.ids, task.id)
+
+    def remove(self, task):
+        i = bisect_left(self.ids, task.id)
+        if i < len(self.ids) and self.ids[i] == task.id:
+            del self.ids[i]
+
+    def rebuild(self, tasks):
+        self.ids = sorted(task.id for task in tasks)
+
+    def after(self, task_id):
+        """Ids greater than task_id (all of them for None), lowest first"""
+        ids = self.ids
+        start = 0 if task_id is None else bisect_right(ids, task_id)
+        for i in range(start, len(ids)):
+            yield ids[i]
+
+class Counters:
+    """Aggregate counts kept in step with every change, like the indexes.
+
+    Pending tasks are also counted per due day, so overdue() for a later
+    day only adds up the days in between.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.completed = 0
+        self.with_due_date = 0
+        # Ordinal day -> pending tasks due that day
+        self.due_days = {}
+        # Concurrent readers may ask for different days
+        self._overdue_lock = threading.Lock()
+        self._day = None
+        self._overdue = 0
+
+    def add(self, task):
+        self._count(task, 1)
+
+    def remove(self, task):
+        self._count(task, -1)
+
+    def _count(self, task, step):
+        self.total += step
+        if task.completed:
+            self.completed += step
+        if task.due:
+            self.with_due_date += step
+        if not task.completed and isinstance(task.due, int):
+            remaining = self.due_days.get(task.due, 0) + step
+            if remaining:
+                self.due_days[task.due] = remaining
+            else:
+                del self.due_days[task.due]
+            if self._day is not None and task.due < self._day:
+                self._overdue += step
+
+    def rebuild(self, tasks):
+        self.total = self.completed = self.with_due_date = 0
+        self.due_days = {}
+        self._day = None
+        for task in tasks:
+            self.add(task)
+
+    def overdue(self, day):
+        """Pending tasks due before day"""
+        with self._overdue_lock:
+            if self._day is None or day < self._day or day - self._day > len(self.due_days):
+                self._overdue = sum(count for due, count in self.due_days.items() if due < day)
+            else:
+                self._overdue += sum(self.due_days.get(due, 0) for due in range(self._day, day))
+            self._day = day
+            return self._overdue
+
+    def counts(self, day):
+        return {
+            "total": self.total,
+            "pending": self.total - self.completed,
+            "completed": self.completed,
+            "with_due_date": self.with_due_date,
+            "overdue": self.overdue(day),
+        }
+
+    def saved(self):
+        """The counts for the .meta sidecar, with pending tasks per ISO due date
+        so a reader can work out overdue for any day"""
+        return {
+            "total": self.total,
+            "pending": self.total - self.completed,
+            "completed": self.completed,
+            "with_due_date": self.with_due_date,
+            "due_days": {date.fromordinal(day).isoformat(): count
+                         for day, count in sorted(self.due_days.items())},
+        }
+
+# Sort keys for Query.order_by(); dates that aren't in the usual format,
+# and tasks without a due date, sort after the rest
+SORT_KEYS = {
+    "id": lambda task: task.id,
+    "title": lambda task: task.title,
+    "due_date": lambda task: (0, task.due) if isinstance(task.due, int) else (1, 0),
+    "created_date": lambda task: ((0, task.created) if isinstance(task.created, int)
+                                  else (1, task.created)),
+    "completed": lambda task: task.completed,
+}
+
+class Query:
+    """A lazy query over a TodoList, built with TodoList.query().
+
+    where() adds filters, which are ANDed; order_by() sorts, ties by id;
+    offset() and limit() cut the result down. Each of these returns a new
+    Query, so one can be built on another. Nothing runs until the query is
+    iterated, and then only one pass is made, with no copy of the task list.
+
+    A small planner picks where the tasks come from (see explain()): the
+    search index for matches=, the id index for id order once page() has
+    built it, the due-date index when one has been built
+    and the query is about pending tasks' due dates, otherwise one pass over
+    the tasks in memory, or over the file when the list isn't loaded.
+    Without order_by() tasks come in whatever order that source gives.
+
+    Don't change the list while iterating a query; all() collects first.
+    """
+
+    FILTERS = ("completed", "due_before", "due_after", "title_contains", "matches", "id_after")
+
+    def __init__(self, todo_list):
+        self.todo_list = todo_list
+        self.filters = {}
+        self.ordering = ()
+        self._offset = 0
+        self._limit = None
+
+    def _copy(self, **changes):
+        query = Query(self.todo_list)
+        query.filters = dict(self.filters)
+        query.ordering = self.ordering
+        query._offset = self._offset
+        query._limit = self._limit
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def where(self, **filters):
+        """Keep only tasks that match every filter:
+
+        completed=True/False, due_before=day and due_after=day (dates or
+        YYYY-MM-DD, exclusive; undated tasks never match), title_contains=
+        text (case-insensitive), matches=query (see SearchIndex.search) and
+        id_after=id. A filter given again replaces the earlier value.
+        """
+        query = self._copy()
+        for name, value in filters.items():
+            if name not in self.FILTERS:
+                raise TypeError(f"unknown filter {name!r}")
+            if name in ("due_before", "due_after"):
+                value = to_day(value)
+            elif name == "title_contains":
+                value = value.lower()
+            query.filters[name] = value
+        return query
+
+    def order_by(self, *fields):
+        """Sort by these fields, in turn; a leading "-" sorts one descending"""
+        ordering = []
+        for field in fields:
+            name = field.lstrip("-")
+            if name not in SORT_KEYS:
+                raise ValueError(f"can't order by {field!r}; use one of {tuple(SORT_KEYS)}")
+            ordering.append((name, field.startswith("-")))
+        return self._copy(ordering=tuple(ordering))
+
+    def offset(self, n):
+        """Skip the first n tasks"""
+        if n < 0:
+            raise ValueError("offset can't be negative")
+        return self._copy(_offset=n)
+
+    def limit(self, n):
+        """Stop after n tasks"""
+        if n < 0:
+            raise ValueError("limit can't be negative")
+        return self._copy(_limit=n)
+
+    def _plan(self):
+        """Return (source name, whether it already yields the requested order)"""
+        todo_list = self.todo_list
+        if "matches" in self.filters:
+            # Index ids come out sorted
+            return "search index", self.ordering == (("id", False),)
+        if self.ordering == (("id", False),) and todo_list._id_index is not None:
+            return "id index", True
+        by_due = self.ordering == (("due_date", False),)
+        if (self.filters.get("completed") is False and todo_list._due_index is not None
+                and ("due_before" in self.filters or "due_after" in self.filters or by_due)):
+            return "due index", by_due
+        return ("scan" if todo_list.loaded else "file scan"), False
+
+    def explain(self):
+        """How the query would run, e.g. "due index, then top-10 sort" """
+        source, ordered = self._plan()
+        steps = [source]
+        if self.ordering and not ordered:
+            if self._limit is None:
+                steps.append("sort")
+            else:
+                steps.append(f"top-{self._offset + self._limit} sort")
+        return ", then ".join(steps)
+
+    def _due_ids(self, index):
+        """Ids from the due-date index, earliest first"""
+        entries = index.entries
+        lo, hi = 0, len(entries)
+        if "due_after" in self.filters:
+            lo = bisect_left(entries, (self.filters["due_after"] + 1,))
+        if "due_before" in self.filters:
+            hi = bisect_left(entries, (self.filters["due_before"],))
+        for i in range(lo, hi):
+            yield entries[i][1]
+        if "due_after" not in self.filters and "due_before" not in self.filters:
+            yield from sorted(index.undated)
+
+    def _check(self):
+        """A predicate for the filters, or None if there are none"""
+        checks = []
+        filters = self.filters
+        if "completed" in filters:
+            completed = filters["completed"]
+            checks.append(lambda task: task.completed == completed)
+        if "due_before" in filters:
+            before = filters["due_before"]
+            checks.append(lambda task: isinstance(task.due, int) and task.due < before)
+        if "due_after" in filters:
+            after = filters["due_after"]
+            checks.append(lambda task: isinstance(task.due, int) and task.due > after)
+        if "title_contains" in filters:
+            text = filters["title_contains"]
+            checks.append(lambda task: text in task.title.lower())
+        if "id_after" in filters:
+            after = filters["id_after"]
+            checks.append(lambda task: task.id > after)
+        if len(checks) <= 1:
+            # The common cases skip the per-task loop over checks
+            return checks[0] if checks else None
+        return lambda task: all(check(task) for check in checks)
+
+    def _sorted(self, tasks):
+        if len({descending for _, descending in self.ordering}) > 1:
+            # Mixed directions: one stable sort per field, last field first
+            ordered = sorted(tasks, key=SORT_KEYS["id"])
+            for name, descending in reversed(self.ordering):
+                ordered.sort(key=SORT_KEYS[name], reverse=descending)
+            return ordered
+        keys = [SORT_KEYS[name] for name, _ in self.ordering]
+        descending = self.ordering[0][1]
+        # Ties go by ascending id either way
+        tie = -1 if descending else 1
+        if len(keys) == 1:
+            first = keys[0]
+            key = lambda task: (first(task), tie * task.id)
+        else:
+            key = lambda task: tuple(k(task) for k in keys) + (tie * task.id,)
+        if self._limit is not None:
+            # Only the first offset + limit are kept, in a heap
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            return pick(self._offset + self._limit, tasks, key=key)
+        return sorted(tasks, key=key, reverse=descending)
+
+    def __iter__(self):
+        todo_list = self.todo_list
+        stats = todo_list._stats
+        began = time.perf_counter()
+        source, ordered = self._plan()
+        if source == "search index":
+            index = todo_list._ensure_search_index()
+        elif source != "file scan":
+            todo_list._ensure_loaded()
+        check = self._check()
+
+        def run():
+            failed = False
+            try:
+                lock = nullcontext() if source == "file scan" else todo_list._read_lock
+                with lock:
+                    if source == "search index":
+                        by_id = todo_list._tasks_by_id
+                        tasks = (by_id[task_id]
+                                 for task_id in sorted(index.search(self.filters["matches"])))
+                    elif source == "id index":
+                        by_id = todo_list._tasks_by_id
+                        tasks = (by_id[task_id] for task_id
+                                 in todo_list._id_index.after(self.filters.get("id_after")))
+                    elif source == "due index":
+                        by_id = todo_list._tasks_by_id
+                        tasks = (by_id[task_id] for task_id in self._due_ids(todo_list._due_index))
+                    elif source == "scan":
+                        tasks = todo_list._tasks_by_id.values()
+                    else:
+                        tasks = todo_list.iter_tasks_from_file()
+                    if check is not None:
+                        tasks = filter(check, tasks)
+                    if self.ordering and not ordered:
+                        tasks = self._sorted(tasks)
+                    stop = None if self._limit is None else self._offset + self._limit
+                    yield from islice(tasks, self._offset, stop)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # Timed here, where the query runs; query() only builds it
+                if stats is not None:
+                    stats.observe("query", time.perf_counter() - began, failed)
+
+        return run()
+
+    def all(self):
+        """The matching tasks as a list"""
+        return list(self)
+
+    def first(self):
+        """The first matching task, or None"""
+        return next(iter(self.limit(1)), None)
+
+    def count(self):
+        """How many tasks match, without collecting them"""
+        return sum(1 for _ in self)
+
+    def page(self, cursor=None, size=20):
+        """One page of the matching tasks in id order, replacing any
+        order_by(), offset() and limit(): returns (tasks, cursor for the next
+        page, or None after the last). A cursor is the id of the last task
+        on its page, so tasks added or removed meanwhile never shift a page.
+        """
+        if size < 1:
+            raise ValueError("page size must be at least 1")
+        query = self._copy(ordering=(("id", False),), _offset=0, _limit=size + 1)
+        if cursor is not None:
+            query.filters["id_after"] = cursor
+        # One task past the page says whether there is another
+        tasks = query.all()
+        if len(tasks) > size:
+            return tasks[:size], tasks[size - 1].id
+        return tasks, None
+
+# TaskTable date columns: no due date, and a date kept as text because it
+# isn't in the usual format
+TABLE_NO_DUE = 0
+TABLE_TEXT_DATE = -(1 << 63)
+
+def month_key(months):
+    """'YYYY-MM' for a count of months since January 1970"""
+    return f"{1970 + months // 12:04d}-{months % 12 + 1:02d}"
+
+class TaskTable:
+    """Tasks stored column by column, for reporting over millions of them.
+
+    ids, created (seconds since 1970) and due (ordinal days, TABLE_NO_DUE
+    for none) are int64 arrays and completed is one byte per task; titles
+    and descriptions are UTF-8 in one buffer each, task i's running from
+    offsets[i] to offsets[i + 1]. Dates that aren't in the usual format
+    hold TABLE_TEXT_DATE and keep their text in created_text/due_text.
+
+    With NumPy installed, columns() gives zero-copy NumPy views and the
+    filters and aggregations below are vectorized; without it they loop
+    over the same arrays in Python. Filters take the same arguments as
+    Query.where(), plus created_before/created_after.
+    """
+
+    FILTERS = ("completed", "due_before", "due_after", "created_before", "created_after",
+               "title_contains")
+
+    def __init__(self):
+        self.ids = array('q')
+        self.created = array('q')
+        self.due = array('q')
+        self.completed = bytearray()
+        self.title_offsets = array('q', [0])
+        self.titles = bytearray()
+        self.description_offsets = array('q', [0])
+        self.descriptions = bytearray()
+        # Row -> text of a date that isn't in the usual format
+        self.created_text = {}
+        self.due_text = {}
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """Build a table from Task objects (any iterable, read once)"""
+        table = cls()
+        ids, created, due, completed = table.ids, table.created, table.due, table.completed
+        titles, title_offsets = table.titles, table.title_offsets
+        descriptions, description_offsets = table.descriptions, table.description_offsets
+        for row, task in enumerate(tasks):
+            ids.append(task.id or 0)
+            if isinstance(task.created, int):
+                created.append(task.created)
+            else:
+                created.append(TABLE_TEXT_DATE)
+                table.created_text[row] = task.created
+            if task.due is None:
+                due.append(TABLE_NO_DUE)
+            elif isinstance(task.due, int):
+                due.append(task.due)
+            else:
+                due.append(TABLE_TEXT_DATE)
+                table.due_text[row] = task.due
+            completed.append(1 if task.completed else 0)
+            titles += task.title.encode()
+            title_offsets.append(len(titles))
+            descriptions += task.description.encode()
+            description_offsets.append(len(descriptions))
+        return table
+
+    def __len__(self):
+        return len(self.ids)
+
+    def title(self, row):
+        return self.titles[self.title_offsets[row]:self.title_offsets[row + 1]].decode()
+
+    def description(self, row):
+        return self.descriptions[
+            self.description_offsets[row]:self.description_offsets[row + 1]].decode()
+
+    def task(self, row):
+        """Task object for one row"""
+        task = Task.__new__(Task)
+        task.id = self.ids[row] or None
+        task.title = self.title(row)
+        task.description = self.description(row)
+        created = self.created[row]
+        task.created = self.created_text[row] if created == TABLE_TEXT_DATE else created
+        due = self.due[row]
+        if due == TABLE_NO_DUE:
+            task.due = None
+        else:
+            task.due = self.due_text[row] if due == TABLE_TEXT_DATE else due
+        task.completed = bool(self.completed[row])
+        return task
+
+    def to_tasks(self):
+        """All rows as Task objects"""
+        return [self.task(row) for row in range(len(self))]
+
+    def take(self, rows):
+        """A new table of these rows, in this order"""
+        return TaskTable.from_tasks(self.task(int(row)) for row in rows)
+
+    def columns(self):
+        """The fixed-width columns by name, as NumPy arrays sharing this
+        table's memory, or the arrays themselves without NumPy"""
+        np = load_numpy()
+        if np is None:
+            return {"id": self.ids, "created": self.created, "due": self.due,
+                    "completed": self.completed}
+        return {
+            "id": np.frombuffer(self.ids, dtype=np.int64),
+            "created": np.frombuffer(self.created, dtype=np.int64),
+            "due": np.frombuffer(self.due, dtype=np.int64),
+            "completed": np.frombuffer(self.completed, dtype=np.bool_),
+        }
+
+    def _bounds(self, filters):
+        """The filters, with dates as ordinal days or seconds"""
+        unknown = set(filters) - set(self.FILTERS)
+        if unknown:
+            raise TypeError(f"unknown filter {sorted(unknown)[0]!r}")
+        bounds = dict(filters)
+        for name in ("due_before", "due_after"):
+            if name in bounds:
+                bounds[name] = to_day(bounds[name])
+        for name in ("created_before", "created_after"):
+            if name in bounds:
+                bounds[name] = (to_day(bounds[name]) - EPOCH_ORDINAL) * 86400
+        if "title_contains" in bounds:
+            bounds["title_contains"] = bounds["title_contains"].lower()
+        return bounds
+
+    def rows(self, **filters):
+        """Numbers of the rows matching every filter, in order (a NumPy
+        array with NumPy, else a list)"""
+        bounds = self._bounds(filters)
+        np = load_numpy()
+        if np is not None:
+            columns = self.columns()
+            due, created = columns["due"], columns["created"]
+            mask = np.ones(len(self), dtype=np.bool_)
+            if "completed" in bounds:
+                mask &= columns["completed"] == bool(bounds["completed"])
+            # Text dates are negative and no due date is 0, so "> 0" is "dated"
+            if "due_before" in bounds:
+                mask &= (due > 0) & (due < bounds["due_before"])
+            if "due_after" in bounds:
+                mask &= due > bounds["due_after"]
+            if "created_before" in bounds:
+                mask &= (created != TABLE_TEXT_DATE) & (created < bounds["created_before"])
+            if "created_after" in bounds:
+                # Created after the day means from the midnight ending it
+                mask &= created >= bounds["created_after"] + 86400
+            rows = np.flatnonzero(mask)
+            if "title_contains" in bounds:
+                text = bounds["title_contains"]
+                rows = rows[[text in self.title(row).lower() for row in rows.tolist()]]
+            return rows
+        matches = []
+        completed = bounds.get("completed")
+        due_before, due_after = bounds.get("due_before"), bounds.get("due_after")
+        created_before, created_after = bounds.get("created_before"), bounds.get("created_after")
+        text = bounds.get("title_contains")
+        for row in range(len(self)):
+            due, created = self.due[row], self.created[row]
+            if completed is not None and bool(self.completed[row]) != bool(completed):
+                continue
+            if due_before is not None and not 0 < due < due_before:
+                continue
+            if due_after is not None and not due > due_after:
+                continue
+            if created_before is not None and not TABLE_TEXT_DATE < created < created_before:
+                continue
+            if created_after is not None and not created >= created_after + 86400:
+                continue
+            if text is not None and text not in self.title(row).lower():
+                continue
+            matches.append(row)
+        return matches
+
+    def where(self, **filters):
+        """A new table of the matching rows"""
+        return self.take(self.rows(**filters))
+
+    def count(self, **filters):
+        return len(self.rows(**filters))
+
+    def completion_rate(self, **filters):
+        """Share of the matching tasks that are completed, or None if none match"""
+        rows = self.rows(**filters)
+        if not len(rows):
+            return None
+        if load_numpy() is not None:
+            return float(self.columns()["completed"][rows].mean())
+        return sum(self.completed[row] for row in rows) / len(rows)
+
+    def counts_by_due_week(self, **filters):
+        """{ISO date of the Monday starting a week: tasks due that week},
+        for the matching tasks with a due date"""
+        rows = self.rows(**filters)
+        np = load_numpy()
+        if np is not None:
+            due = self.columns()["due"][rows]
+            due = due[due > 0]
+            # Ordinal day 1 was a Monday
+            weeks, counts = np.unique(due - (due - 1) % 7, return_counts=True)
+            return {date.fromordinal(week).isoformat(): count
+                    for week, count in zip(weeks.tolist(), counts.tolist())}
+        counts = {}
+        for row in rows:
+            due = self.due[row]
+            if due > 0:
+                week = due - (due - 1) % 7
+                counts[week] = counts.get(week, 0) + 1
+        return {date.fromordinal(week).isoformat(): counts[week] for week in sorted(counts)}
+
+    def completion_rate_by_created_month(self, **filters):
+        """{'YYYY-MM': share completed} by the month the matching tasks were created"""
+        rows = self.rows(**filters)
+        np = load_numpy()
+        if np is not None:
+            columns = self.columns()
+            created = columns["created"][rows]
+            completed = columns["completed"][rows]
+            dated = created != TABLE_TEXT_DATE
+            months = (created[dated].astype("datetime64[s]").astype("datetime64[M]")
+                      .astype(np.int64))
+            if not len(months):
+                return {}
+            first = int(months.min())
+            totals = np.bincount(months - first)
+            done = np.bincount(months - first, weights=completed[dated])
+            return {month_key(first + i): float(done[i] / totals[i])
+                    for i in np.flatnonzero(totals).tolist()}
+        totals, done = {}, {}
+        # Many tasks share a day, so each day is turned into a month once
+        month_of_day = {}
+        for row in rows:
+            created = self.created[row]
+            if created == TABLE_TEXT_DATE:
+                continue
+            day = created // 86400
+            month = month_of_day.get(day)
+            if month is None:
+                when = date.fromordinal(EPOCH_ORDINAL + day)
+                month = month_of_day[day] = (when.year - 1970) * 12 + when.month - 1
+            totals[month] = totals.get(month, 0) + 1
+            done[month] = done.get(month, 0) + self.completed[row]
+        return {month_key(month): done[month] / totals[month] for month in sorted(totals)}
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array read incrementally from f"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    state = "start"  # start -> first -> (value -> comma_or_end)*
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos == len(buf) and not eof:
+            chunk = f.read(chunk_size)
+            buf, pos, eof = chunk, 0, not chunk
+            continue
+        if pos == len(buf):
+            raise json.JSONDecodeError("Unterminated array", buf, pos)
+        char = buf[pos]
+        if state == "start":
+            if char != "[":
+                raise json.JSONDecodeError("Expecting '['", buf, pos)
+            pos, state = pos + 1, "first"
+        elif char == "]" and state in ("first", "comma_or_end"):
+            return
+        elif state == "comma_or_end":
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos, state = pos + 1, "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = len(buf)
+            # A value running to the end of the buffer may continue in the
+            # next chunk, so read more and decode it again.
+            if end == len(buf) and not eof:
+                chunk = f.read(chunk_size)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                continue
+            yield value
+            pos, state = end, "comma_or_end"
+
+# Binary snapshot format: a header, then one length-prefixed record per task.
+# Records have a fixed, key-free layout with dates as integers; strings
+# follow as UTF-8. Readers skip any bytes a newer version adds to a record.
+BINARY_MAGIC = b"TODO"
+BINARY_VERSION = 2
+# magic, version, reserved, total tasks, pending tasks
+BINARY_HEADER = struct.Struct("<4sHHQQ")
+# Version 2 follows the header with the next id to hand out, so ids of
+# deleted tasks are never reused
+BINARY_NEXT_ID = struct.Struct("<Q")
+# record length, id (0: none), created seconds, due ordinal day, flags,
+# title bytes, description bytes
+BINARY_RECORD = struct.Struct("<IqqiBII")
+BINARY_LENGTH = struct.Struct("<I")
+# Record flags; dates that aren't in canonical form are kept as text after
+# the description, created first
+COMPLETED = 1
+CREATED_TEXT = 2
+DUE_TEXT = 4
+NO_DUE = 8
+
+def encode_task(task):
+    """One task as a binary record"""
+    title = task.title.encode()
+    description = task.description.encode()
+    flags = COMPLETED if task.completed else 0
+    created, due, extra = task.created, task.due, b""
+    if not isinstance(created, int):
+        text = str(created).encode()
+        flags |= CREATED_TEXT
+        created, extra = 0, BINARY_LENGTH.pack(len(text)) + text
+    if due is None:
+        flags |= NO_DUE
+        due = 0
+    elif not isinstance(due, int):
+        text = str(due).encode()
+        flags |= DUE_TEXT
+        due, extra = 0, extra + BINARY_LENGTH.pack(len(text)) + text
+    length = BINARY_RECORD.size + len(title) + len(description) + len(extra)
+    return b"".join((BINARY_RECORD.pack(length, task.id or 0, created, due, flags,
+                                        len(title), len(description)),
+                     title, description, extra))
+
+def write_binary(f, tasks, next_id=1, chunk_size=10_000):
+    """Write tasks to a binary file opened for writing; returns (total, pending).
+    The header records next_id, or one past the highest id if that is more."""
+    header = f.tell()
+    f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, 0, 0))
+    f.write(BINARY_NEXT_ID.pack(0))
+    total = pending = 0
+    chunk = []
+    for task in tasks:
+        chunk.append(encode_task(task))
+        total += 1
+        pending += not task.completed
+        if task.id is not None:
+            next_id = max(next_id, task.id + 1)
+        if len(chunk) >= chunk_size:
+            f.write(b"".join(chunk))
+            chunk.clear()
+    f.write(b"".join(chunk))
+    # Counts are only known at the end; patch them into the header
+    end = f.tell()
+    f.seek(header)
+    f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, total, pending))
+    f.write(BINARY_NEXT_ID.pack(next_id))
+    f.seek(end)
+    return total, pending
+
+def read_binary_header(f):
+    """Return (total, pending, next id) from a binary file's header; the
+    next id is 1 for version 1 files, which didn't record it"""
+    data = f.read(BINARY_HEADER.size)
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("not a binary todo file: too short")
+    magic, version, _, total, pending = BINARY_HEADER.unpack(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("not a binary todo file")
+    if version > BINARY_VERSION:
+        raise ValueError(f"binary todo file version {version} is newer than this program")
+    next_id = 1
+    if version >= 2:
+        data = f.read(BINARY_NEXT_ID.size)
+        if len(data) < BINARY_NEXT_ID.size:
+            raise ValueError("not a binary todo file: too short")
+        next_id, = BINARY_NEXT_ID.unpack(data)
+    return total, pending, next_id
+
+def read_binary(f):
+    """Return (tasks, next id) from a binary file opened for reading"""
+    total, _, next_id = read_binary_header(f)
+    data = f.read()
+    # Tasks can't form reference cycles, so spare the collector the passes
+    # a million new objects would otherwise set off
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return list(read_records(data, total)), next_id
+    finally:
+        if collecting:
+            gc.enable()
+
+def read_records(data, total):
+    """Yield total tasks decoded from binary records at the start of data"""
+    unpack = BINARY_RECORD.unpack_from
+    fixed = BINARY_RECORD.size
+    new = Task.__new__
+    offset = 0
+    for _ in range(total):
+        length, task_id, created, due, flags, title_size, description_size = unpack(data, offset)
+        start = offset + fixed
+        task = new(Task)
+        task.id = task_id or None
+        task.title = data[start:start + title_size].decode()
+        start += title_size
+        task.description = data[start:start + description_size].decode()
+        start += description_size
+        if flags & CREATED_TEXT:
+            size, = BINARY_LENGTH.unpack_from(data, start)
+            start += BINARY_LENGTH.size
+            created = data[start:start + size].decode()
+            start += size
+        task.created = created
+        if flags & NO_DUE:
+            due = None
+        elif flags & DUE_TEXT:
+            size, = BINARY_LENGTH.unpack_from(data, start)
+            start += BINARY_LENGTH.size
+            due = data[start:start + size].decode()
+        task.due = due
+        task.completed = bool(flags & COMPLETED)
+        yield task
+        offset += length
+
+class BulkOperations:
+    """Bulk mutations built on batch(), shared by the TodoList backends"""
+
+    def add_tasks(self, specs):
+        """Add tasks from titles, (title, description, due_date) tuples or
+        keyword dicts, saving once; returns the new tasks"""
+        with self.batch():
+            tasks = []
+            for spec in specs:
+                if isinstance(spec, str):
+                    tasks.append(self.add_task(spec))
+                elif isinstance(spec, dict):
+                    tasks.append(self.add_task(**spec))
+                else:
+                    tasks.append(self.add_task(*spec))
+            return tasks
+
+    def complete_tasks(self, task_ids):
+        """Mark several tasks completed, saving once; returns how many were found"""
+        with self.batch():
+            return sum(1 for task_id in task_ids if self.complete_task_by_id(task_id))
+
+    def delete_tasks(self, task_ids):
+        """Delete several tasks, saving once; returns how many were found"""
+        with self.batch():
+            return sum(1 for task_id in task_ids if self.delete_task_by_id(task_id))
+
+class StorageBackend:
+    """Where a TodoList keeps its tasks, in place of its own JSON files.
+
+    load() returns (tasks, entries): the tasks as last saved and the journal
+    entries (see TodoList._record) appended since. append_op() persists more
+    entries and returns how many bytes of them have piled up, so the list
+    can snapshot() once that passes its compact_threshold.
+
+    Ids are never reused: save() and snapshot() are given the list's next
+    id, and load() sets next_id to the highest one saved, which may be past
+    every task left. load() also sets bytes_read, for stats(), if it reads
+    files. filename is the file the tasks are kept in, if there is one.
+    """
+
+    next_id = 1
+    bytes_read = 0
+    filename = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, tasks, next_id=1):
+        """Replace everything stored with these tasks"""
+        raise NotImplementedError
+
+    def append_op(self, entries):
+        raise NotImplementedError
+
+    def snapshot(self, tasks, next_id=1):
+        """Fold the appended entries away; tasks is the state they lead to"""
+        self.save(tasks, next_id)
+
+    def close(self):
+        pass
+
+class MemoryBackend(StorageBackend):
+    """Keeps task dicts in memory only; for tests and as a benchmark baseline"""
+
+    def __init__(self, tasks=()):
+        self.tasks = {task.id: task.to_dict() for task in tasks}
+
+    def load(self):
+        return [Task.from_dict(data) for data in self.tasks.values()], []
+
+    def save(self, tasks, next_id=1):
+        self.tasks = {task.id: task.to_dict() for task in tasks}
+        self.next_id = max(self.next_id, next_id)
+
+    def append_op(self, entries):
+        for entry in entries:
+            if entry["op"] == "add":
+                self.tasks[entry["task"]["id"]] = dict(entry["task"])
+                self.next_id = max(self.next_id, entry["task"]["id"] + 1)
+            elif entry["op"] == "delete":
+                self.tasks.pop(entry["id"], None)
+            elif entry["id"] in self.tasks:
+                self.tasks[entry["id"]].update(entry_fields(entry))
+        return 0
+
+class LogBackend(StorageBackend):
+    """A snapshot file plus a JSON-lines log of the entries appended since.
+
+    Subclasses define the snapshot format with read_snapshot(f) and
+    write_snapshot(f, tasks, next_id), opening the file in snapshot_mode.
+    save() leaves a log of just the header, which holds the next id.
+    """
+
+    snapshot_mode = ''
+
+    def __init__(self, filename, sync=False):
+        self.filename = filename
+        self.log_filename = filename + ".log"
+        self.sync = sync
+
+    def load(self):
+        tasks = []
+        self.next_id = 1
+        self.bytes_read = 0
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r' + self.snapshot_mode) as f:
+                tasks = self.read_snapshot(f)
+                self.bytes_read += bytes_read(f)
+        entries = []
+        if os.path.exists(self.log_filename):
+            with open(self.log_filename, 'r') as f:
+                try:
+                    header = json.loads(next(f, "null"))
+                except json.JSONDecodeError:
+                    header = None
+                if isinstance(header, dict):
+                    # Still a lower bound when the log itself is stale
+                    self.next_id = max(self.next_id, header.get("next_id", 1))
+                # A log written against an older snapshot is left over from a
+                # save() interrupted before it removed the log; the snapshot
+                # already holds its entries
+                stale = not isinstance(header, dict) or header.get("base") != file_signature(
+                    self.filename)
+                for line in () if stale else f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A torn final line from an interrupted append
+                        break
+                self.bytes_read += bytes_read(f)
+            if stale:
+                # Later entries must not land behind the stale header
+                os.remove(self.log_filename)
+        return tasks, entries
+
+    def save(self, tasks, next_id=1):
+        atomic_write(self.filename, lambda f: self.write_snapshot(f, tasks, next_id),
+                     sync=self.sync, mode='w' + self.snapshot_mode)
+        # Replaces any log, whose entries the snapshot now holds
+        header = {"base": file_signature(self.filename), "next_id": next_id}
+        atomic_write(self.log_filename, lambda f: f.write(json.dumps(header) + "\n"),
+                     sync=self.sync)
+
+    def append_op(self, entries):
+        if not entries:
+            return 0
+        with open(self.log_filename, 'a') as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"base": file_signature(self.filename)}) + "\n")
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+            return f.tell()
+
+class JsonBackend(LogBackend):
+    """A JSON snapshot and log, in the same formats as TodoList(filename,
+    journal=True) but without its cross-process locking"""
+
+    def __init__(self, filename="todo.json", sync=False):
+        super().__init__(filename, sync)
+
+    def read_snapshot(self, f):
+        return [Task.from_dict(data) for data in iter_json_array(f)]
+
+    def write_snapshot(self, f, tasks, next_id):
+        json.dump([task.to_dict() for task in tasks], f, indent=2)
+
+class BinaryBackend(LogBackend):
+    """The binary format (see write_binary) as snapshot, with a JSON-lines log"""
+
+    snapshot_mode = 'b'
+
+    def __init__(self, filename="todo.bin", sync=False):
+        super().__init__(filename, sync)
+
+    def read_snapshot(self, f):
+        tasks, self.next_id = read_binary(f)
+        return tasks
+
+    def write_snapshot(self, f, tasks, next_id):
+        write_binary(f, tasks, next_id)
+
+class SqliteBackend(StorageBackend):
+    """Tasks in a SQLite table, changed row by row so nothing is rewritten whole"""
+
+    def __init__(self, filename="todo.db", sync=False):
         self.filename = filename
-        self.tasks = []
-        self.load_tasks()
+        # TodoList's locks keep threads from using the connection at once
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        # Without sync, WAL commits survive a crash of the process but may
+        # not survive one of the OS, like the JSON files' unsynced writes
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(f"PRAGMA synchronous = {'FULL' if sync else 'NORMAL'}")
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def load(self):
+        self.next_id = sqlite_next_id(self.conn)
+        rows = self.conn.execute(f"SELECT {SQLITE_COLUMNS} FROM tasks ORDER BY id")
+        return [task_from_row(row) for row in rows], []
+
+    def save(self, tasks, next_id=1):
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks")
+            self.conn.executemany(SQLITE_INSERT, (task_row(task) for task in tasks))
+            sqlite_keep_next_id(self.conn, next_id)
+
+    def append_op(self, entries):
+        with self.conn:
+            for entry in entries:
+                if entry["op"] == "add":
+                    self.conn.execute(SQLITE_INSERT, task_row(Task.from_dict(entry["task"])))
+                    sqlite_keep_next_id(self.conn, entry["task"]["id"] + 1)
+                elif entry["op"] == "delete":
+                    self.conn.execute("DELETE FROM tasks WHERE id = ?", (entry["id"],))
+                else:
+                    changes = entry_fields(entry)
+                    if not changes:
+                        # An update that sets nothing
+                        continue
+                    if "completed" in changes:
+                        changes["completed"] = int(changes["completed"])
+                    assignments = ", ".join(f"{field} = ?" for field in changes)
+                    self.conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ?",
+                                      (*changes.values(), entry["id"]))
+        # Every change is already in place; there is never anything to fold in
+        return 0
+
+    def close(self):
+        self.conn.close()
+
+class FileLock:
+    """Advisory lock shared by every process using the same todo list.
+
+    Threads of one process share a hold, since they already coordinate among
+    themselves: the OS lock is taken by the first and dropped by the last.
+    synced is cleared each time the OS lock is newly taken.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.synced = False
+        self._holders = 0
+        self._mutex = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        with self._mutex:
+            if self._holders == 0:
+                f = open(self.path, 'a')
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    except BaseException:
+                        f.close()
+                        raise
+                self._file = f
+                self.synced = False
+            self._holders += 1
+
+    def release(self):
+        with self._mutex:
+            self._holders -= 1
+            if self._holders == 0:
+                # Closing the file drops the lock
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer.
+
+    Waiting writers block new readers so a steady stream of reads can't
+    starve them. Both sides are reentrant and the writing thread may also
+    read, but a reader can't upgrade to writing.
+    """
+
+    class Side:
+        """One side of the lock, usable in a with statement"""
+
+        def __init__(self, acquire, release):
+            self._acquire = acquire
+            self._release = release
+
+        def __enter__(self):
+            self._acquire()
+
+        def __exit__(self, *exc):
+            self._release()
+
+    def __init__(self):
+        self._changed = threading.Condition(threading.Lock())
+        # Read depth per thread, so a reader can re-enter past waiting writers
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self.reader = self.Side(self.acquire_read, self.release_read)
+        self.writer = self.Side(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._changed:
+            if self._writer != me and me not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    self._changed.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._changed:
+            depth = self._readers[me] - 1
+            if depth:
+                self._readers[me] = depth
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._changed.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._changed:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("cannot take the write lock while holding the read lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._changed.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._changed:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._changed.notify_all()
+
+class Stats:
+    """Call counts, latency histograms and file bytes for one TodoList"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Operation name -> [calls, errors, total seconds, slowest, bucket counts]
+        self.operations = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def wrap(self, name, method):
+        """Return method, timed under name"""
+        observe = self.observe
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            failed = True
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                observe(name, perf_counter() - start, failed)
+        return timed
+
+    def observe(self, name, seconds, failed=False):
+        with self._lock:
+            operation = self.operations.get(name)
+            if operation is None:
+                operation = self.operations[name] = [0, 0, 0.0, 0.0,
+                                                     [0] * (len(LATENCY_BUCKETS) + 1)]
+            operation[0] += 1
+            operation[1] += failed
+            operation[2] += seconds
+            operation[3] = max(operation[3], seconds)
+            operation[4][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def read(self, size):
+        with self._lock:
+            self.bytes_read += size
+
+    def written(self, size):
+        with self._lock:
+            self.bytes_written += size
+
+    def report(self):
+        with self._lock:
+            operations = {}
+            for name, (calls, errors, total, slowest, counts) in sorted(self.operations.items()):
+                cumulative = list(accumulate(counts))
+
+                def quantile(q):
+                    # Upper bound of the bucket holding it, so an estimate
+                    for bound, seen in zip(LATENCY_BUCKETS, cumulative):
+                        if seen >= q * calls:
+                            return min(bound, slowest) * 1e3
+                    return slowest * 1e3
+
+                operations[name] = {
+                    "calls": calls,
+                    "errors": errors,
+                    "total_seconds": total,
+                    "mean_ms": total / calls * 1e3,
+                    "p50_ms": quantile(0.5),
+                    "p99_ms": quantile(0.99),
+                    "max_ms": slowest * 1e3,
+                    "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"],
+                                        cumulative)),
+                }
+            return {"bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                    "operations": operations}
+
+def prometheus_text(report):
+    """A stats() report in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{labels} {value}")
+
+    if report["instrumented"]:
+        operations = report["operations"]
+        metric("todo_operation_seconds", "histogram", "Latency of TodoList operations.",
+               [(f'_bucket{{operation="{name}",le="{bound}"}}', count)
+                for name, operation in operations.items()
+                for bound, count in operation["buckets"].items()])
+        # The _sum and _count series belong to the histogram above
+        for name, operation in operations.items():
+            lines.append(f'todo_operation_seconds_sum{{operation="{name}"}} '
+                         f'{operation["total_seconds"]}')
+            lines.append(f'todo_operation_seconds_count{{operation="{name}"}} '
+                         f'{operation["calls"]}')
+        metric("todo_operation_errors_total", "counter", "TodoList operations that raised.",
+               [(f'{{operation="{name}"}}', operation["errors"])
+                for name, operation in operations.items()])
+        metric("todo_bytes_read_total", "counter", "Bytes read from the task files.",
+               [("", report["bytes_read"])])
+        metric("todo_bytes_written_total", "counter", "Bytes written to the task files.",
+               [("", report["bytes_written"])])
+    if report["tasks"] is not None:
+        metric("todo_tasks", "gauge", "Tasks in the list.",
+               [(f'{{state="{state}"}}', count) for state, count in report["tasks"].items()])
+    return "\n".join(lines) + "\n"
+
+class TodoList(BulkOperations):
+    def __init__(self, filename="todo.json", journal=False,
+                 compact_threshold=JOURNAL_COMPACT_BYTES, lazy=False,
+                 persist_index=False, durability="periodic", fsync_interval=1.0,
+                 write_behind=False, flush_interval=0.05, flush_every=1000, backend=None,
+                 archive_after=None, instrument=False):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"durability must be one of {DURABILITY_POLICIES}")
+        self.filename = filename
+        self.journal = journal
+        self.journal_filename = filename + ".log"
+        self.meta_filename = filename + ".meta"
+        self.index_filename = filename + ".idx"
+        self.lock_filename = filename + ".lock"
+        # A StorageBackend to use instead of filename's JSON files; journal,
+        # durability and the sidecar and locking features are then its concern
+        self.backend = backend
+        # Completed tasks move to this separate list (see archive()), which
+        # is only opened when it is needed. It sits next to the file the
+        # tasks are kept in; a backend without one can't archive.
+        kept_in = filename if backend is None else backend.filename
+        self.archive_filename = None if kept_in is None else kept_in + ".archive"
+        self.archive_after = archive_after
+        self._archive = None
+        self.compact_threshold = compact_threshold
+        self.persist_index = persist_index
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self._last_fsync = 0.0
+        # Files written without an fsync under "periodic", and the timer that
+        # syncs them once fsync_interval is up
+        self._unsynced = set()
+        self._sync_timer = None
+        self._sync_lock = threading.Lock()
+        # Tasks keyed by their stable id, in list order; None until loaded
+        self._tasks_by_id = None
+        self._next_id = 1
+        # Secondary indexes kept in step with every add, change and removal;
+        # the counters behind counts() are always one of them
+        self._counters = Counters()
+        self._indexes = [self._counters]
+        self._search_index = None
+        self._due_index = None
+        self._id_index = None
+        self._compaction = None
+        # Bumped on every change to the tasks in memory, e.g. for HTTP ETags
+        self.version = 0
+        # Pending journal entries and undo state while inside batch()
+        self._batch = None
+        # Lock order is always read/write lock -> _file_lock -> _io_lock ->
+        # _pending_changed.
+        # Mutations hold the write lock; snapshots of the task set are taken
+        # under the read lock; _io_lock orders writes to the files.
+        self._read_lock, self._write_lock = self._make_locks()
+        self._io_lock = threading.RLock()
+        # Other processes may share the file: every write holds _file_lock
+        # and first merges in whatever changed on disk since _disk_version.
+        self._file_lock = FileLock(self.lock_filename)
+        self._disk_version = None
+        # Bumped for every snapshot taken so an older one is never written
+        # over a newer one
+        self._generation = 0
+        self._written_generation = 0
+        # Write-behind: mutations queue here and a background thread writes
+        # them out flush_interval seconds after the first, or once
+        # flush_every have piled up, whichever comes first.
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._pending = []
+        self._pending_changed = threading.Condition()
+        self._closing = False
+        self._writer = None
+        # Timings and file bytes for stats(). Left off, no method is wrapped
+        # and the only cost is a None check per file read or write.
+        self._stats = None
+        if instrument:
+            self._stats = Stats()
+            for name in INSTRUMENTED_METHODS:
+                setattr(self, name, self._stats.wrap(name, getattr(self, name)))
+        if write_behind:
+            self._start_writer()
+        if not lazy:
+            self.load_tasks()
+
+    def _make_locks(self):
+        """Return (read lock, write lock); here one lock shared by both"""
+        lock = threading.RLock()
+        return lock, lock
+
+    @property
+    def loaded(self):
+        return self._tasks_by_id is not None
+
+    def _ensure_loaded(self):
+        if self._tasks_by_id is None:
+            with self._write_lock:
+                if self._tasks_by_id is None:
+                    self.load_tasks()
+
+    @property
+    def tasks_by_id(self):
+        self._ensure_loaded()
+        return self._tasks_by_id
+
+    @tasks_by_id.setter
+    def tasks_by_id(self, value):
+        self._tasks_by_id = value
+
+    @property
+    def next_id(self):
+        self._ensure_loaded()
+        return self._next_id
+
+    @next_id.setter
+    def next_id(self, value):
+        self._next_id = value
+
+    @contextmanager
+    def _reading(self):
+        """Hold the read lock, loading tasks first so that never happens under it"""
+        self._ensure_loaded()
+        with self._read_lock:
+            yield
 
     def load_tasks(self):
-        """Load tasks from file"""
+        """Load tasks from file, replaying any journaled operations"""
+        if self.backend is not None:
+            with self._write_lock:
+                tasks, entries = self.backend.load()
+                self._set_tasks(tasks)
+                for entry in entries:
+                    self._apply(entry)
+                self._next_id = max(self._next_id, self.backend.next_id)
+                if self._stats is not None:
+                    self._stats.read(self.backend.bytes_read)
+                self.version += 1
+        else:
+            with self._write_lock, self._file_lock:
+                rotated = self._read_disk()
+                self._file_lock.synced = True
+                if rotated:
+                    # Finish the interrupted compaction before appending again
+                    self.save_tasks()
+        if self.archive_after is not None:
+            self.archive(self.archive_after)
+
+    def _read_disk(self):
+        """Replace the tasks in memory with those on disk; returns whether an
+        interrupted compaction left a rotated log behind"""
         if os.path.exists(self.filename):
             try:
                 with open(self.filename, 'r') as f:
-                    data = json.load(f)
-                    self.tasks = [Task.from_dict(task_data) for task_data in data]
+                    self._set_tasks(Task.from_dict(task_data)
+                                    for task_data in iter_json_array(f))
+                    self._count_read(f)
             except json.JSONDecodeError:
-                print("Error reading file. Starting with empty task list.")
-                self.tasks = []
+                # Keep the damaged file so the next save can't destroy it
+                os.replace(self.filename, self.filename + ".corrupt")
+                print(f"Error reading file (kept as {self.filename}.corrupt). "
+                      "Starting with empty task list.")
+                self._set_tasks([])
         else:
-            self.tasks = []
+            self._set_tasks([])
+        rotated = self._replay_journal()
+        # Deleted tasks' ids stay used up
+        self._next_id = max(self._next_id, self._saved_next_id())
+        self._disk_version = self._current_version()
+        self.version += 1
+        return rotated
+
+    def _saved_next_id(self):
+        """The id high-water mark kept in the .meta sidecar and log headers.
+        Any of them is a safe lower bound, even one older than the snapshot."""
+        next_id = 1
+        try:
+            with open(self.meta_filename, 'r') as f:
+                meta = json.load(f)
+                self._count_read(f)
+            next_id = meta.get("next_id", 1)
+        except (OSError, ValueError, AttributeError):
+            pass
+        for path in (self.journal_filename + ".1", self.journal_filename):
+            try:
+                with open(path, 'r') as f:
+                    header = json.loads(f.readline())
+                    self._count_read(f)
+                next_id = max(next_id, header.get("next_id", 1))
+            except (OSError, ValueError, AttributeError):
+                pass
+        return next_id
+
+    def _count_read(self, f):
+        """Add what has been read through open file f to stats()"""
+        if self._stats is not None:
+            self._stats.read(bytes_read(f))
+
+    def refresh(self):
+        """Pick up changes other processes have saved since this list last
+        read or wrote the file"""
+        self._ensure_loaded()
+        if self.backend is not None:
+            with self._write_lock:
+                self.flush()
+                self.load_tasks()
+            return
+        with self._write_lock, self._file_lock:
+            self._catch_up([])
+
+    def _sync(self, entries):
+        """Merge in other processes' changes once per hold of the file lock,
+        before writing entries (ours, not yet on disk) under it"""
+        if not self._file_lock.synced:
+            self._catch_up(entries)
+            self._file_lock.synced = True
+
+    def _catch_up(self, entries):
+        if self._current_version() == self._disk_version:
+            return
+        previous = self._tasks_by_id
+        self._read_disk()
+        remap = {}
+        with self._pending_changed:
+            for queue in (entries, self._pending):
+                queue[:] = self._merge(queue, previous, remap)
+
+    def _merge(self, entries, previous, remap):
+        """Re-apply our unsaved entries on top of freshly read tasks; returns
+        the ones still meaningful, with ids another process took reassigned"""
+        kept = []
+        # Ids below this were handed out by whoever wrote the disk state, even
+        # if those tasks have been deleted since
+        taken = self._next_id
+        for entry in entries:
+            if entry["op"] == "add":
+                task_id = entry["task"]["id"]
+                # Keep handing out the Task objects callers already hold
+                task = previous.get(task_id) or Task.from_dict(entry["task"])
+                if task_id in self._tasks_by_id or task_id < taken:
+                    remap[task_id] = task.id = entry["task"]["id"] = self._next_id
+                self._insert(task)
+            else:
+                entry["id"] = remap.get(entry["id"], entry["id"])
+                if entry["id"] not in self._tasks_by_id:
+                    # Deleted by another process; its delete wins
+                    continue
+                self._apply(entry)
+            kept.append(entry)
+        return kept
+
+    def _set_tasks(self, tasks):
+        """Replace the task set, giving ids to tasks saved before ids existed"""
+        self._tasks_by_id = {}
+        legacy = []
+        for task in tasks:
+            if task.id is None:
+                legacy.append(task)
+            else:
+                self.tasks_by_id[task.id] = task
+        self.next_id = max(self.tasks_by_id, default=0) + 1
+        for task in legacy:
+            task.id = self.next_id
+            self.next_id += 1
+            self.tasks_by_id[task.id] = task
+        self._rebuild_indexes()
+
+    def _rebuild_indexes(self):
+        for index in self._indexes:
+            index.rebuild(self._tasks_by_id.values())
+
+    def _insert(self, task):
+        if task.id is None:
+            task.id = self.next_id
+        self.next_id = max(self.next_id, task.id + 1)
+        self.tasks_by_id[task.id] = task
+        for index in self._indexes:
+            index.add(task)
+        if self._batch is not None:
+            self._batch["added"].append(task.id)
+
+    def _remove(self, task_id):
+        task = self.tasks_by_id.pop(task_id, None)
+        if task is not None:
+            for index in self._indexes:
+                index.remove(task)
+            if self._batch is not None:
+                self._batch["removed"].append(task)
+        return task
+
+    def _change(self, task, **fields):
+        for index in self._indexes:
+            index.remove(task)
+        for field, value in fields.items():
+            setattr(task, field, value)
+        for index in self._indexes:
+            index.add(task)
+
+    @property
+    def tasks(self):
+        with self._reading():
+            return list(self._tasks_by_id.values())
+
+    def _id_at(self, index):
+        """Map a list position (as shown by get_tasks()) to a task id"""
+        if 0 <= index < len(self.tasks_by_id):
+            return next(islice(self.tasks_by_id, index, None))
+        return None
+
+    def _capture(self):
+        """Serializable copy of the task set, its counts and the search
+        postings, if persisted"""
+        data = [task.to_dict() for task in self._tasks_by_id.values()]
+        postings = None
+        if self.persist_index:
+            postings = {token: sorted(ids) for token, ids in self._search_index.postings.items()}
+        return data, {**self._counters.saved(), "next_id": self._next_id}, postings
 
     def save_tasks(self):
         """Save tasks to file"""
-        with open(self.filename, 'w') as f:
-            data = [task.to_dict() for task in self.tasks]
-            json.dump(data, f, indent=2)
+        if self.backend is not None:
+            self._ensure_loaded()
+            with self._write_lock:
+                # Everything queued so far is covered by this save
+                self._take_pending()
+                self.backend.save(list(self._tasks_by_id.values()), self._next_id)
+            return
+        if self.journal:
+            # The journal is the source of truth for anything newer than the
+            # snapshot, so rewriting the snapshot is a compaction.
+            self.compact(force=True)
+            return
+        self._save([])
+
+    def _save(self, entries):
+        """Rewrite the snapshot, after merging in other processes' changes
+        (entries are the mutations this save is for)"""
+        if self.persist_index:
+            self._ensure_search_index()
+        self._ensure_loaded()
+        with self._file_lock:
+            with self._write_lock:
+                # Everything queued so far is covered by this snapshot
+                entries = entries + self._take_pending()
+                self._sync(entries)
+                data, counts, postings = self._capture()
+                self._generation += 1
+                generation = self._generation
+            with self._io_lock:
+                if generation > self._written_generation:
+                    self._write_snapshot(data, counts, postings)
+                    self._written_generation = generation
+                self._remove_journal()
+                self._disk_version = self._current_version()
+
+    def compact(self, background=False, force=False):
+        """Fold the journal into a fresh todo.json snapshot.
+
+        Does nothing when there is no journal to fold in, unless force is set.
+        """
+        if self.backend is not None:
+            self._ensure_loaded()
+            with self._write_lock:
+                self._take_pending()
+                self.backend.snapshot(list(self._tasks_by_id.values()), self._next_id)
+            return
+        if self.persist_index:
+            self._ensure_search_index()
+        self._ensure_loaded()
+        with self._write_lock:
+            self.wait_for_compaction()
+            # Queued entries go into the log being rotated, never after it
+            entries = self._take_pending()
+            # Held until the snapshot is written, so other processes never
+            # see a compaction half done
+            self._file_lock.acquire()
+            try:
+                self._sync(entries)
+                with self._io_lock:
+                    self._append(entries)
+                    leftover = os.path.exists(self.journal_filename + ".1")
+                    if not (leftover or os.path.exists(self.journal_filename) or force):
+                        self._file_lock.release()
+                        return
+                    data, counts, postings = self._capture()
+                    if leftover:
+                        # Left by an interrupted compaction and already loaded:
+                        # fold everything in now rather than rotate over it
+                        background = False
+                    elif os.path.exists(self.journal_filename):
+                        # New mutations go to a fresh log while the rotated one
+                        # is folded in
+                        os.replace(self.journal_filename, self.journal_filename + ".1")
+            except BaseException:
+                self._file_lock.release()
+                raise
+
+            def run():
+                try:
+                    self._write_snapshot(data, counts, postings)
+                    with self._io_lock:
+                        if leftover:
+                            self._remove_journal()
+                        elif os.path.exists(self.journal_filename + ".1"):
+                            os.remove(self.journal_filename + ".1")
+                        self._disk_version = self._current_version()
+                finally:
+                    self._file_lock.release()
+
+            if background:
+                self._compaction = threading.Thread(target=run, name="todo-compaction")
+                self._compaction.start()
+            else:
+                run()
+
+    def wait_for_compaction(self):
+        """Block until a background compaction has finished"""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+            self._compaction = None
+
+    def _should_fsync(self, path):
+        """Whether the write to path being made should be fsynced. Under
+        "periodic" one that isn't is synced later, with the next synced write
+        or by a timer, so none stays unsynced much past fsync_interval."""
+        if self.durability == "always":
+            return True
+        if self.durability != "periodic":
+            return False
+        with self._sync_lock:
+            now = time.monotonic()
+            if now - self._last_fsync < self.fsync_interval:
+                self._unsynced.add(path)
+                if self._sync_timer is None:
+                    self._sync_timer = threading.Timer(
+                        self._last_fsync + self.fsync_interval - now, self._sync_unsynced)
+                    self._sync_timer.daemon = True
+                    self._sync_timer.start()
+                return False
+            self._last_fsync = now
+            self._unsynced.discard(path)
+        # This write's caller syncs path itself
+        self._sync_unsynced()
+        return True
+
+    def _sync_unsynced(self):
+        """fsync the files written since the last fsync"""
+        with self._sync_lock:
+            paths, self._unsynced = self._unsynced, set()
+            timer, self._sync_timer = self._sync_timer, None
+            if paths:
+                self._last_fsync = time.monotonic()
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        with self._io_lock:
+            for path in paths:
+                fsync_file(path)
+
+    def _write_snapshot(self, data, counts, postings=None):
+        # Contents unsynced behind a durable rename could leave an empty file
+        atomic_write(self.filename, lambda f: json.dump(data, f, indent=2),
+                     sync=self.durability != "never",
+                     sync_rename=self._should_fsync(self.filename))
+        signature = self._snapshot_signature()
+        if self._stats is not None:
+            self._stats.written(signature[1])
+        # Sidecars are derived data checked against the snapshot signature,
+        # so they are replaced atomically but never fsynced.
+        if postings is not None:
+            atomic_write(self.index_filename, lambda f: json.dump(
+                {"snapshot": signature, "postings": postings}, f))
+            if self._stats is not None:
+                self._stats.written(os.path.getsize(self.index_filename))
+        # The sidecar lets counts() answer without parsing the snapshot
+        meta = {"snapshot": signature, **counts}
+        atomic_write(self.meta_filename, lambda f: json.dump(meta, f))
+        if self._stats is not None:
+            self._stats.written(os.path.getsize(self.meta_filename))
+
+    def counts(self, now=None):
+        """Return {"total", "pending", "completed", "with_due_date", "overdue"},
+        overdue meaning pending tasks due before now (default: today).
+
+        A loaded list keeps these up to date as it changes; otherwise they come
+        from the .meta sidecar when it matches the snapshot, without loading.
+        """
+        day = to_day(now or date.today())
+        if self.loaded or self.backend is not None:
+            with self._reading():
+                return self._counters.counts(day)
+        with self._file_lock:
+            journaled = any(os.path.exists(path)
+                            for path in (self.journal_filename, self.journal_filename + ".1"))
+            if not journaled:
+                if not os.path.exists(self.filename):
+                    return Counters().counts(day)
+                try:
+                    with open(self.meta_filename, 'r') as f:
+                        meta = json.load(f)
+                        self._count_read(f)
+                    if meta["snapshot"] == self._snapshot_signature():
+                        today = date.fromordinal(day).isoformat()
+                        return {
+                            "total": meta["total"],
+                            "pending": meta["pending"],
+                            "completed": meta["completed"],
+                            "with_due_date": meta["with_due_date"],
+                            "overdue": sum(count for due, count in meta["due_days"].items()
+                                           if due < today),
+                        }
+                except (OSError, ValueError, KeyError):
+                    pass
+        # Missing or stale sidecar: count in a single streaming pass
+        counters = Counters()
+        for task in self.iter_tasks_from_file():
+            counters.add(task)
+        return counters.counts(day)
+
+    def _snapshot_signature(self):
+        return file_signature(self.filename)
+
+    def _current_version(self):
+        """Signatures of every file that holds tasks, to spot other processes' writes"""
+        return [file_signature(path) for path in
+                (self.filename, self.journal_filename, self.journal_filename + ".1")]
+
+    def _remove_journal(self):
+        for path in (self.journal_filename + ".1", self.journal_filename):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _read_journal(self, path):
+        """Return (header, entries) for a log file, or None if it doesn't exist"""
+        if not os.path.exists(path):
+            return None
+        header, entries = None, []
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted append
+                    break
+                if header is None:
+                    header = entry
+                else:
+                    entries.append(entry)
+            self._count_read(f)
+        return header, entries
+
+    def _journal_entries(self):
+        """Return (entries still to apply on top of the snapshot, whether a
+        rotated log was found)"""
+        rotated = self._read_journal(self.journal_filename + ".1")
+        current = self._read_journal(self.journal_filename)
+        entries = []
+        if rotated is not None:
+            header, rotated_entries = rotated
+            # Once compaction has replaced the snapshot, the rotated log is
+            # already part of it and must not be applied twice.
+            if header is not None and header.get("base") == self._snapshot_signature():
+                entries.extend(rotated_entries)
+        if current is not None:
+            entries.extend(current[1])
+        return entries, rotated is not None
+
+    def _replay_journal(self):
+        entries, rotated = self._journal_entries()
+        for entry in entries:
+            self._apply(entry)
+        return rotated
+
+    def iter_tasks_from_file(self):
+        """Yield tasks one at a time straight from the file, with journaled
+        changes applied, without building the whole task list"""
+        if self.backend is not None:
+            yield from self.tasks
+            return
+        with self._file_lock:
+            entries, _ = self._journal_entries()
+            # The open file keeps this snapshot even if a compaction replaces it
+            f = open(self.filename, 'r') if os.path.exists(self.filename) else None
+        added = {}
+        deleted = set()
+        changes = {}
+        for entry in entries:
+            if "index" in entry:
+                raise ValueError("journal predates task ids; compact() it first")
+            if entry["op"] == "add":
+                task = Task.from_dict(entry["task"])
+                added[task.id] = task
+            elif entry["id"] in added:
+                task = added[entry["id"]]
+                if entry["op"] == "delete":
+                    del added[task.id]
+                else:
+                    self._apply_fields(task, entry)
+            elif entry["op"] == "delete":
+                deleted.add(entry["id"])
+            else:
+                changes.setdefault(entry["id"], []).append(entry)
+        def tasks():
+            # Tasks saved before ids existed are numbered after the rest,
+            # as load_tasks() does
+            legacy = []
+            last_id = 0
+            if f is not None:
+                with f:
+                    try:
+                        for data in iter_json_array(f):
+                            task = Task.from_dict(data)
+                            if task.id is None:
+                                legacy.append(task)
+                            else:
+                                last_id = max(last_id, task.id)
+                                yield task
+                    finally:
+                        # Also when the caller stops early
+                        self._count_read(f)
+            for task in legacy:
+                last_id += 1
+                task.id = last_id
+                yield task
+
+        for task in tasks():
+            if task.id in deleted:
+                continue
+            for entry in changes.get(task.id, ()):
+                self._apply_fields(task, entry)
+            yield task
+        yield from added.values()
+
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "add":
+            self._insert(Task.from_dict(entry["task"]))
+            return
+        # Logs written before tasks had ids address them by position
+        task_id = entry["id"] if "id" in entry else self._id_at(entry["index"])
+        if op == "delete":
+            self._remove(task_id)
+        else:
+            self._change(self.tasks_by_id[task_id], **entry_fields(entry))
+
+    @staticmethod
+    def _apply_fields(task, entry):
+        for field, value in entry_fields(entry).items():
+            setattr(task, field, value)
+
+    def _record(self, entry):
+        """Persist a mutation now, or queue it until the enclosing batch ends"""
+        self.version += 1
+        if self._batch is not None:
+            self._batch["entries"].append(entry)
+        else:
+            self._persist([entry])
+
+    def _persist(self, entries):
+        """Write entries out now, or hand them to the write-behind thread"""
+        if self.write_behind and not self._closing:
+            with self._pending_changed:
+                self._pending.extend(entries)
+                self._pending_changed.notify()
+        elif self.backend is not None:
+            if self.backend.append_op(entries) >= self.compact_threshold:
+                self.compact()
+        elif self.journal:
+            with self._file_lock:
+                self._sync(entries)
+                with self._io_lock:
+                    size = self._append(entries)
+            if size >= self.compact_threshold:
+                self.compact(background=True)
+        else:
+            self._save(entries)
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._write_behind_loop,
+                                        name="todo-write-behind", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _take_pending(self):
+        with self._pending_changed:
+            entries, self._pending = self._pending, []
+        return entries
+
+    def _write_behind_loop(self):
+        with self._pending_changed:
+            while True:
+                while not self._pending and not self._closing:
+                    self._pending_changed.wait()
+                if self._closing:
+                    return
+                # Coalesce the burst that is under way into one write
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.flush_every and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_changed.wait(remaining)
+                self._pending_changed.release()
+                try:
+                    self.flush()
+                finally:
+                    self._pending_changed.acquire()
+
+    def flush(self):
+        """Write out any mutations queued by write-behind mode"""
+        with self._pending_changed:
+            if not self._pending:
+                return
+        if self.backend is not None:
+            with self._write_lock:
+                size = self.backend.append_op(self._take_pending())
+            if size >= self.compact_threshold:
+                self.compact()
+            return
+        if not self.journal:
+            self._save([])
+            return
+        with self._write_lock:
+            entries = self._take_pending()
+            with self._file_lock:
+                self._sync(entries)
+                with self._io_lock:
+                    size = self._append(entries)
+        if size >= self.compact_threshold:
+            self.compact(background=True)
+
+    def close(self):
+        """Stop the write-behind thread and write out everything still queued"""
+        if self._writer is not None:
+            with self._pending_changed:
+                self._closing = True
+                self._pending_changed.notify()
+            self._writer.join()
+            self._writer = None
+            atexit.unregister(self.close)
+        self.flush()
+        self.wait_for_compaction()
+        self._sync_unsynced()
+        if self.backend is not None:
+            self.backend.close()
+        if self._archive is not None:
+            self._archive.close()
+
+    def stats(self, format=None):
+        """Task counts and, with instrument=True, per-operation call counts,
+        latency histograms and bytes read and written. Returned as a dict,
+        or as text with format="json" or format="prometheus".
+
+        Bytes read are counted where a file is actually read, sidecars and
+        streaming reads included, and for a backend as far as it reports
+        them; bytes written are only counted for the JSON files.
+        """
+        if format not in (None, "json", "prometheus"):
+            raise ValueError('format must be None, "json" or "prometheus"')
+        report = {"instrumented": self._stats is not None, "version": self.version}
+        if self._stats is not None:
+            report.update(self._stats.report())
+        # stats() never loads the list just to count it
+        report["tasks"] = None
+        if self.loaded:
+            with self._read_lock:
+                report["tasks"] = self._counters.counts(to_day(date.today()))
+        if format == "json":
+            return json.dumps(report, indent=2)
+        if format == "prometheus":
+            return prometheus_text(report)
+        return report
+
+    def _append(self, entries):
+        """Append entries to the journal (under _io_lock); returns its size"""
+        if not entries:
+            return 0
+        with open(self.journal_filename, 'a') as f:
+            start = f.tell()
+            created = start == 0
+            if created:
+                f.write(json.dumps({"base": self._snapshot_signature(),
+                                    "next_id": self._next_id}) + "\n")
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            size = f.tell()
+            if self._stats is not None:
+                self._stats.written(size - start)
+            if self._should_fsync(self.journal_filename):
+                f.flush()
+                os.fsync(f.fileno())
+                if created:
+                    fsync_directory(self.journal_filename)
+        self._disk_version = self._current_version()
+        return size
+
+    def _touch(self, task):
+        """Remember a task's fields before the first change to it in a batch"""
+        if self._batch is not None and task.id not in self._batch["fields"]:
+            self._batch["fields"][task.id] = (
+                task, task.title, task.description, task.due, task.completed
+            )
+
+    @contextmanager
+    def batch(self):
+        """Save once when the block exits; undo in-memory changes if it raises.
+
+        Nested batches join the outermost one. Undoing costs as much as the
+        changes made, not the size of the list; tasks a failed batch deleted
+        come back at the end of the list order.
+        """
+        self._ensure_loaded()
+        with self._write_lock:
+            if self._batch is not None:
+                yield self
+                return
+            # An undo log: ids added, tasks removed and the fields of tasks
+            # changed, as they were before the batch
+            self._batch = {
+                "entries": [],
+                "added": [],
+                "removed": [],
+                "next_id": self.next_id,
+                "fields": {}
+            }
+            try:
+                yield self
+            except BaseException:
+                batch, self._batch = self._batch, None
+                added = set(batch["added"])
+                for task_id in added:
+                    self._remove(task_id)
+                for task in batch["removed"]:
+                    if task.id not in added:
+                        self._insert(task)
+                for task, title, description, due, completed in batch["fields"].values():
+                    if task.id in added:
+                        continue
+                    self._change(task, title=title, description=description, due=due,
+                                 completed=completed)
+                self.next_id = batch["next_id"]
+                raise
+            entries = self._batch["entries"]
+            self._batch = None
+            if entries:
+                self._persist(entries)
+
+    def add_task(self, title, description="", due_date=None):
+        """Add a new task"""
+        task = Task(title, description, due_date)
+        if self._tasks_by_id is None and self._append_unloaded(task):
+            return task
+        self._ensure_loaded()
+        with self._write_lock:
+            self._insert(task)
+            self._record({"op": "add", "task": task.to_dict()})
+            return task
+
+    def _append_unloaded(self, task):
+        """Journal an add to a lazy list without loading it, numbering the
+        task from the .meta sidecar and the journal. Returns False, having
+        done nothing, where that can't be done safely."""
+        if not self.journal or self.backend is not None or self.write_behind:
+            return False
+        with self._write_lock, self._file_lock:
+            if self._tasks_by_id is not None:
+                return False
+            task.id = self._unloaded_next_id()
+            if task.id is None:
+                return False
+            self._next_id = task.id + 1
+            self.version += 1
+            with self._io_lock:
+                size = self._append([{"op": "add", "task": task.to_dict()}])
+        if size >= self.compact_threshold:
+            self.compact(background=True)
+        return True
+
+    def _unloaded_next_id(self):
+        """The next id, without reading the snapshot: past the .meta
+        sidecar's mark, if it matches the snapshot, and every journaled add.
+        None when the sidecar can't vouch for the snapshot."""
+        next_id = 1
+        if os.path.exists(self.filename):
+            try:
+                with open(self.meta_filename, 'r') as f:
+                    meta = json.load(f)
+                    self._count_read(f)
+                if meta["snapshot"] != self._snapshot_signature():
+                    return None
+                next_id = meta["next_id"]
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+        next_id = max(next_id, self._saved_next_id())
+        for entry in self._journal_entries()[0]:
+            if entry["op"] == "add":
+                if entry["task"].get("id") is None:
+                    # Journaled before tasks had ids
+                    return None
+                next_id = max(next_id, entry["task"]["id"] + 1)
+        return next_id
+
+    def insert_tasks(self, tasks):
+        """Insert Task objects in one batch, keeping their ids if they have one
+        that is still free"""
+        with self.batch():
+            for task in tasks:
+                if task.id in self.tasks_by_id:
+                    task.id = None
+                self._insert(task)
+                self._record({"op": "add", "task": task.to_dict()})
+
+    @property
+    def archive_list(self):
+        """The TodoList of archived tasks, opened on first use"""
+        if self._archive is None:
+            if self.archive_filename is None:
+                raise ValueError("this backend keeps no file to archive next to")
+            self._archive = TodoList(self.archive_filename, journal=True, lazy=True,
+                                     durability=self.durability,
+                                     fsync_interval=self.fsync_interval)
+        return self._archive
+
+    def archive(self, older_than=30, now=None):
+        """Move completed tasks created more than older_than days before now
+        (default: today) to the archive; returns how many moved.
+
+        Tasks don't record when they were completed, so their age is counted
+        from when they were created.
+        """
+        cutoff = (to_day(now or date.today()) - older_than - EPOCH_ORDINAL) * 86400
+        self._ensure_loaded()
+        with self._write_lock:
+            cold = [task for task in self._tasks_by_id.values()
+                    if task.completed and isinstance(task.created, int) and task.created < cutoff]
+            if cold:
+                # Archive first: a crash in between leaves a task in both
+                # lists, never in neither. Ids are never reused, so one
+                # already archived is that same task, archived before the crash.
+                archive = self.archive_list
+                archive.insert_tasks(Task.from_dict(task.to_dict()) for task in cold
+                                     if archive.get_task(task.id) is None)
+                self.delete_tasks([task.id for task in cold])
+        return len(cold)
+
+    def archived_tasks(self):
+        """All archived tasks"""
+        return self.archive_list.get_tasks()
+
+    def search_archive(self, query):
+        """Find archived tasks matching query (see SearchIndex.search)"""
+        return self.archive_list.search(query)
+
+    def restore(self, task_ids):
+        """Move tasks back from the archive, keeping their ids; returns them"""
+        archive = self.archive_list
+        self._ensure_loaded()
+        with self._write_lock:
+            found = [task for task in map(archive.get_task, task_ids) if task is not None]
+            # A task still here was restored before a crash kept it from
+            # leaving the archive; ids are never reused, so it is the same one
+            self.insert_tasks(Task.from_dict(task.to_dict()) for task in found
+                              if task.id not in self._tasks_by_id)
+            archive.delete_tasks([task.id for task in found])
+            return [self._tasks_by_id[task.id] for task in found]
+
+    def get_task(self, task_id):
+        """Get a task by id, or None"""
+        with self._reading():
+            return self._tasks_by_id.get(task_id)
+
+    def complete_task_by_id(self, task_id):
+        """Mark the task with this id as completed"""
+        self._ensure_loaded()
+        with self._write_lock:
+            task = self.tasks_by_id.get(task_id)
+            if task is None:
+                return False
+            self._touch(task)
+            self._change(task, completed=True)
+            self._record({"op": "complete", "id": task_id})
+            return True
+
+    def delete_task_by_id(self, task_id):
+        """Delete the task with this id"""
+        self._ensure_loaded()
+        with self._write_lock:
+            if self._remove(task_id) is None:
+                return False
+            self._record({"op": "delete", "id": task_id})
+            return True
+
+    def update_task_by_id(self, task_id, title=None, description=None, due_date=None):
+        """Update details of the task with this id"""
+        self._ensure_loaded()
+        with self._write_lock:
+            task = self.tasks_by_id.get(task_id)
+            if task is None:
+                return False
+            self._touch(task)
+            entry = {"op": "update", "id": task_id}
+            if title:
+                entry["title"] = title
+            if description:
+                entry["description"] = description
+            if due_date:
+                entry["due_date"] = due_date
+            self._change(task, **entry_fields(entry))
+            self._record(entry)
+            return True
+
+    def complete_task(self, index):
+        """Mark a task as completed"""
+        self._ensure_loaded()
+        with self._write_lock:
+            return self.complete_task_by_id(self._id_at(index))
+
+    def delete_task(self, index):
+        """Delete a task"""
+        self._ensure_loaded()
+        with self._write_lock:
+            return self.delete_task_by_id(self._id_at(index))
+
+    def get_tasks(self, include_completed=True):
+        """Get all tasks or only incomplete tasks"""
+        with self._reading():
+            if include_completed:
+                return list(self._tasks_by_id.values())
+            return [task for task in self._tasks_by_id.values() if not task.completed]
+
+    def table(self):
+        """The tasks as a columnar TaskTable for reporting; streamed from the
+        file when the list isn't loaded"""
+        if not self.loaded and self.backend is None:
+            return TaskTable.from_tasks(self.iter_tasks_from_file())
+        with self._reading():
+            return TaskTable.from_tasks(self._tasks_by_id.values())
+
+    def query(self):
+        """Start a Query over the tasks, e.g.
+        todo_list.query().where(completed=False).order_by("due_date").limit(10)"""
+        return Query(self)
+
+    def page(self, cursor=None, size=20):
+        """A page of tasks in id order and the cursor for the next one; see
+        Query.page. Filter first with query().where(...).page(...)."""
+        if self.loaded:
+            self._ensure_id_index()
+        return self.query().page(cursor, size)
+
+    def _ensure_id_index(self):
+        if self._id_index is None:
+            self._ensure_loaded()
+            with self._write_lock:
+                if self._id_index is None:
+                    index = IdIndex()
+                    index.rebuild(self._tasks_by_id.values())
+                    self._indexes.append(index)
+                    self._id_index = index
+        return self._id_index
+
+    def _ensure_due_index(self):
+        if self._due_index is None:
+            self._ensure_loaded()
+            with self._write_lock:
+                if self._due_index is None:
+                    index = DueIndex()
+                    index.rebuild(self._tasks_by_id.values())
+                    self._indexes.append(index)
+                    self._due_index = index
+        return self._due_index
+
+    def _due_query(self, pick):
+        """Tasks for the ids pick() selects from the due-date index"""
+        index = self._ensure_due_index()
+        with self._read_lock:
+            return [self._tasks_by_id[task_id] for task_id in pick(index)]
+
+    def tasks_due_between(self, start, end):
+        """Pending tasks due within [start, end] (dates or YYYY-MM-DD), earliest first"""
+        start, end = to_day(start), to_day(end)
+        return self._due_query(lambda index: index.between(start, end))
+
+    def overdue(self, now=None):
+        """Pending tasks due before now (default: today), earliest first"""
+        day = to_day(now or date.today())
+        return self._due_query(lambda index: index.before(day))
+
+    def next_due(self, k, now=None):
+        """The k pending tasks due soonest on or after now (default: today)"""
+        day = to_day(now or date.today())
+        return self._due_query(lambda index: index.first_from(day, k))
+
+    def undated_tasks(self):
+        """Pending tasks without a YYYY-MM-DD due date"""
+        return self._due_query(lambda index: sorted(index.undated))
+
+    def search(self, query):
+        """Find tasks whose title or description match query (see SearchIndex.search)"""
+        index = self._ensure_search_index()
+        with self._read_lock:
+            return [self._tasks_by_id[task_id] for task_id in sorted(index.search(query))]
+
+    def _ensure_search_index(self):
+        if self._search_index is None:
+            self._ensure_loaded()
+            with self._write_lock:
+                if self._search_index is None:
+                    index = self._load_search_index()
+                    if index is None:
+                        index = SearchIndex()
+                        index.rebuild(self._tasks_by_id.values())
+                    self._indexes.append(index)
+                    self._search_index = index
+        return self._search_index
+
+    def _load_search_index(self):
+        """Read the persisted index and bring it up to date with the journal"""
+        if not self.persist_index or self.backend is not None:
+            return None
+        self.wait_for_compaction()
+        with self._file_lock, self._io_lock:
+            try:
+                with open(self.index_filename, 'r') as f:
+                    saved = json.load(f)
+                    self._count_read(f)
+            except (OSError, ValueError):
+                return None
+            if saved.get("snapshot") != self._snapshot_signature():
+                return None
+            entries, _ = self._journal_entries()
+            with self._pending_changed:
+                entries.extend(self._pending)
+        index = SearchIndex({token: set(ids) for token, ids in saved["postings"].items()})
+        # Tasks touched since the snapshot are dropped and re-added as they are now
+        dirty = {entry["task"]["id"] if entry["op"] == "add" else entry.get("id")
+                 for entry in entries}
+        if None in dirty:
+            return None
+        if dirty:
+            for token in list(index.postings):
+                index.postings[token] -= dirty
+                if not index.postings[token]:
+                    del index.postings[token]
+            for task_id in dirty:
+                if task_id in self._tasks_by_id:
+                    index.add(self._tasks_by_id[task_id])
+        return index
+
+    def update_task(self, index, title=None, description=None, due_date=None):
+        """Update task details"""
+        self._ensure_loaded()
+        with self._write_lock:
+            return self.update_task_by_id(self._id_at(index), title, description, due_date)
+
+class ThreadSafeTodoList(TodoList):
+    """TodoList that may be shared between threads.
+
+    Queries take a shared read lock, so they run alongside each other;
+    mutations take an exclusive write lock and are applied one at a time.
+    """
+
+    def _make_locks(self):
+        lock = ReadWriteLock()
+        return lock.reader, lock.writer
+
+class DeferredTodoList(ThreadSafeTodoList):
+    """Queues mutations like write-behind mode, but leaves calling flush() to its owner"""
+
+    def _start_writer(self):
+        pass
+
+class AsyncTodoList:
+    """asyncio front end to a TodoList.
+
+    Every call that takes the list's locks runs in the default executor, as
+    a write holds them while it snapshots the tasks and would otherwise
+    stall the event loop. A mutation returns once it is on disk, and all
+    mutations made while one write is under way share the next.
+    """
+
+    def __init__(self, filename="todo.json", **options):
+        # asyncio is imported here rather than slowing down every import of
+        # this module
+        import asyncio
+        self.todo_list = DeferredTodoList(filename, lazy=True, write_behind=True, **options)
+        self._write_lock = asyncio.Lock()
+        self._mutations = 0
+        self._written = 0
+
+    async def __aenter__(self):
+        await self._loaded()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, func, *args):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _loaded(self):
+        if not self.todo_list.loaded:
+            await self._run(self.todo_list._ensure_loaded)
+
+    async def _commit(self):
+        """Wait until this mutation is written, sharing the write with every
+        mutation made before it starts"""
+        self._mutations += 1
+        mutation = self._mutations
+        async with self._write_lock:
+            if self._written >= mutation:
+                return
+            covered = self._mutations
+            await self._run(self.todo_list.flush)
+            self._written = covered
+
+    async def _mutate(self, method, *args):
+        result = await self._run(method, *args)
+        await self._commit()
+        return result
+
+    async def flush(self):
+        """Write out anything still queued"""
+        async with self._write_lock:
+            await self._run(self.todo_list.flush)
+
+    async def close(self):
+        """Write out anything still queued and wait for background compaction"""
+        async with self._write_lock:
+            await self._run(self.todo_list.close)
+
+    async def add_task(self, title, description="", due_date=None):
+        """Add a new task"""
+        return await self._mutate(self.todo_list.add_task, title, description, due_date)
+
+    async def add_tasks(self, specs):
+        """Add many tasks with one write; see BulkOperations.add_tasks"""
+        return await self._mutate(self.todo_list.add_tasks, specs)
+
+    async def complete_task_by_id(self, task_id):
+        """Mark the task with this id as completed"""
+        return await self._mutate(self.todo_list.complete_task_by_id, task_id)
+
+    async def complete_tasks(self, ids):
+        """Complete many tasks with one write"""
+        return await self._mutate(self.todo_list.complete_tasks, ids)
+
+    async def delete_task_by_id(self, task_id):
+        """Delete the task with this id"""
+        return await self._mutate(self.todo_list.delete_task_by_id, task_id)
+
+    async def delete_tasks(self, ids):
+        """Delete many tasks with one write"""
+        return await self._mutate(self.todo_list.delete_tasks, ids)
+
+    async def update_task_by_id(self, task_id, title=None, description=None, due_date=None):
+        """Update details of the task with this id"""
+        return await self._mutate(self.todo_list.update_task_by_id,
+                                  task_id, title, description, due_date)
+
+    async def complete_task(self, index):
+        """Mark a task as completed"""
+        return await self._mutate(self.todo_list.complete_task, index)
+
+    async def delete_task(self, index):
+        """Delete a task"""
+        return await self._mutate(self.todo_list.delete_task, index)
+
+    async def update_task(self, index, title=None, description=None, due_date=None):
+        """Update task details"""
+        return await self._mutate(self.todo_list.update_task, index, title, description, due_date)
+
+    async def get_task(self, task_id):
+        """Get a task by id, or None"""
+        return await self._run(self.todo_list.get_task, task_id)
+
+    async def get_tasks(self, include_completed=True):
+        """Get all tasks or only incomplete tasks"""
+        return await self._run(self.todo_list.get_tasks, include_completed)
+
+    async def query(self):
+        """A Query over the tasks (see TodoList.query). Iterating it takes the
+        read lock, so run it with fetch() rather than on the event loop."""
+        await self._loaded()
+        return self.todo_list.query()
+
+    async def fetch(self, query):
+        """The tasks a query() matches, as a list"""
+        return await self._run(query.all)
+
+    async def page(self, cursor=None, size=20):
+        """A page of tasks and the next cursor; see TodoList.page"""
+        return await self._run(self.todo_list.page, cursor, size)
+
+    async def counts(self, now=None):
+        """Aggregate counts; see TodoList.counts"""
+        return await self._run(self.todo_list.counts, now)
+
+    async def tasks_due_between(self, start, end):
+        """Pending tasks due within [start, end], earliest first"""
+        return await self._run(self.todo_list.tasks_due_between, start, end)
+
+    async def overdue(self, now=None):
+        """Pending tasks due before now (default: today), earliest first"""
+        return await self._run(self.todo_list.overdue, now)
+
+    async def next_due(self, k, now=None):
+        """The k pending tasks due soonest on or after now (default: today)"""
+        return await self._run(self.todo_list.next_due, k, now)
+
+    async def search(self, query):
+        """Find tasks matching query; the first search may read the index file"""
+        return await self._run(self.todo_list.search, query)
+
+    async def refresh(self):
+        """Pick up changes other processes have saved"""
+        await self._run(self.todo_list.refresh)
+
+    def stats(self, format=None):
+        """See TodoList.stats; pass instrument=True to collect timings"""
+        return self.todo_list.stats(format)
+
+class SqliteTodoList(BulkOperations):
+    """TodoList with the same interface, backed by an indexed SQLite file"""
+
+    COLUMNS = SQLITE_COLUMNS
+
+    def __init__(self, filename="todo.db"):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self._batch_depth = 0
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    @property
+    def tasks(self):
+        return self.get_tasks()
+
+    def load_tasks(self):
+        """Tasks are read on demand; nothing to load up front"""
+
+    def save_tasks(self):
+        """Commit any pending changes"""
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _write(self):
+        """Run statements in their own transaction unless inside batch()"""
+        if self._batch_depth:
+            yield
+        else:
+            with self.conn:
+                yield
+
+    @contextmanager
+    def batch(self):
+        """Commit once when the block exits; roll back if it raises"""
+        self._batch_depth += 1
+        try:
+            if self._batch_depth > 1:
+                yield self
+            else:
+                with self.conn:
+                    yield self
+        finally:
+            self._batch_depth -= 1
+
+    def _id_at(self, index):
+        """Map a list position (as shown by get_tasks()) to a task id"""
+        if index < 0:
+            return None
+        row = self.conn.execute(
+            "SELECT id FROM tasks ORDER BY id LIMIT 1 OFFSET ?", (index,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def insert_tasks(self, tasks):
+        """Insert Task objects in one transaction, keeping their ids if they have one"""
+        with self._write():
+            next_id = sqlite_next_id(self.conn)
+            for t in tasks:
+                if t.id is None:
+                    # Not SQLite's rowid choice, which reuses a deleted last id
+                    t.id = next_id
+                self.conn.execute(SQLITE_INSERT, task_row(t))
+                next_id = max(next_id, t.id + 1)
+            sqlite_keep_next_id(self.conn, next_id)
 
     def add_task(self, title, description="", due_date=None):
         """Add a new task"""
         task = Task(title, description, due_date)
-        self.tasks.append(task)
-        self.save_tasks()
+        self.insert_tasks([task])
         return task
 
+    def get_task(self, task_id):
+        """Get a task by id, or None"""
+        row = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        return task_from_row(row) if row else None
+
+    def complete_task_by_id(self, task_id):
+        """Mark the task with this id as completed"""
+        with self._write():
+            cursor = self.conn.execute("UPDATE tasks SET completed = 1 WHERE id = ?", (task_id,))
+        return cursor.rowcount > 0
+
+    def delete_task_by_id(self, task_id):
+        """Delete the task with this id"""
+        with self._write():
+            cursor = self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        return cursor.rowcount > 0
+
+    def update_task_by_id(self, task_id, title=None, description=None, due_date=None):
+        """Update details of the task with this id"""
+        changes = {}
+        if title:
+            changes["title"] = title
+        if description:
+            changes["description"] = description
+        if due_date:
+            changes["due_date"] = due_date
+        assignments = ", ".join(f"{column} = ?" for column in changes) or "id = id"
+        with self._write():
+            cursor = self.conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ?",
+                (*changes.values(), task_id)
+            )
+        return cursor.rowcount > 0
+
     def complete_task(self, index):
         """Mark a task as completed"""
-        if 0 <= index < len(self.tasks):
-            self.tasks[index].completed = True
-            self.save_tasks()
-            return True
-        return False
+        return self.complete_task_by_id(self._id_at(index))
 
     def delete_task(self, index):
         """Delete a task"""
-        if 0 <= index < len(self.tasks):
-            del self.tasks[index]
-            self.save_tasks()
-            return True
-        return False
+        return self.delete_task_by_id(self._id_at(index))
 
     def get_tasks(self, include_completed=True):
         """Get all tasks or only incomplete tasks"""
-        if include_completed:
-            return self.tasks
-        return [task for task in self.tasks if not task.completed]
+        query = f"SELECT {self.COLUMNS} FROM tasks"
+        if not include_completed:
+            query += " WHERE completed = 0"
+        rows = self.conn.execute(query + " ORDER BY id")
+        return [task_from_row(row) for row in rows]
+
+    def page(self, cursor=None, size=20):
+        """One page of tasks in id order and the cursor for the next, or
+        None after the last; see Query.page"""
+        if size < 1:
+            raise ValueError("page size must be at least 1")
+        rows = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM tasks WHERE id > ? ORDER BY id LIMIT ?",
+            (0 if cursor is None else cursor, size + 1)
+        ).fetchall()
+        tasks = [task_from_row(row) for row in rows[:size]]
+        return tasks, tasks[-1].id if len(rows) > size else None
+
+    def counts(self, now=None):
+        """Return {"total", "pending", "completed", "with_due_date", "overdue"},
+        overdue meaning pending tasks due before now (default: today)"""
+        today = date.fromordinal(to_day(now or date.today())).isoformat()
+        total, completed, with_due_date, overdue = self.conn.execute(
+            "SELECT COUNT(*), TOTAL(completed), TOTAL(due_date != ''), "
+            "TOTAL(completed = 0 AND due_date < ? "
+            "AND due_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]') FROM tasks",
+            (today,)
+        ).fetchone()
+        return {
+            "total": total,
+            "pending": total - int(completed),
+            "completed": int(completed),
+            "with_due_date": int(with_due_date),
+            "overdue": int(overdue),
+        }
+
+    def refresh(self):
+        """Queries always read what has been committed; nothing to refresh"""
+
+    def _due_query(self, condition, params, limit=-1):
+        rows = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM tasks WHERE completed = 0 AND {condition} "
+            "AND due_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' "
+            "ORDER BY due_date, id LIMIT ?",
+            (*params, limit)
+        )
+        return [task_from_row(row) for row in rows]
+
+    def tasks_due_between(self, start, end):
+        """Pending tasks due within [start, end] (dates or YYYY-MM-DD), earliest first"""
+        return self._due_query("due_date BETWEEN ? AND ?",
+                               (date.fromordinal(to_day(start)).isoformat(),
+                                date.fromordinal(to_day(end)).isoformat()))
+
+    def overdue(self, now=None):
+        """Pending tasks due before now (default: today), earliest first"""
+        today = date.fromordinal(to_day(now or date.today())).isoformat()
+        return self._due_query("due_date < ?", (today,))
+
+    def next_due(self, k, now=None):
+        """The k pending tasks due soonest on or after now (default: today)"""
+        today = date.fromordinal(to_day(now or date.today())).isoformat()
+        return self._due_query("due_date >= ?", (today,), k)
 
     def update_task(self, index, title=None, description=None, due_date=None):
         """Update task details"""
-        if 0 <= index < len(self.tasks):
-            task = self.tasks[index]
-            if title:
-                task.title = title
-            if description:
-                task.description = description
-            if due_date:
-                task.due_date = due_date
-            self.save_tasks()
-            return True
-        return False
+        return self.update_task_by_id(self._id_at(index), title, description, due_date)
+
+def migrate_json_to_sqlite(json_filename="todo.json", db_filename="todo.db"):
+    """Copy every task from a todo.json file into a SQLite database"""
+    source = TodoList(json_filename)
+    target = SqliteTodoList(db_filename)
+    with target.batch():
+        target.insert_tasks(source.tasks)
+        sqlite_keep_next_id(target.conn, source.next_id)
+    return target
+
+def convert_json_to_binary(json_filename="todo.json", binary_filename="todo.bin"):
+    """Write every task in a todo.json file (journal included) to the binary format"""
+    source = TodoList(json_filename, lazy=True)
+    next_id = source._saved_next_id()
+    atomic_write(binary_filename,
+                 lambda f: write_binary(f, source.iter_tasks_from_file(), next_id),
+                 mode='wb')
+
+def convert_binary_to_json(binary_filename="todo.bin", json_filename="todo.json"):
+    """Write every task in a binary file (log included) to a todo.json file"""
+    source = TodoList(binary_filename, backend=BinaryBackend(binary_filename))
+    # Also drops any journal the target had, which would no longer apply
+    JsonBackend(json_filename).save(source.tasks, source.next_id)
+
+def open_todo_list(filename, **options):
+    """TodoList for filename, in the binary format if it ends in .bin"""
+    if filename.endswith(".bin"):
+        return TodoList(filename, backend=BinaryBackend(filename), **options)
+    return TodoList(filename, **options)
+
+# Tasks shown at a time by the interactive menu
+PAGE_SIZE = 20
+
+def browse(todo_list, prompt):
+    """Show tasks a page at a time, "n"/"p" moving between pages, and return
+    the first other answer to prompt, or None if there are no tasks"""
+    # The cursor each page shown so far started from
+    cursors = [None]
+    while True:
+        tasks, next_cursor = todo_list.page(cursors[-1], PAGE_SIZE)
+        if not tasks and len(cursors) > 1:
+            # Everything from here on was deleted meanwhile
+            cursors.pop()
+            continue
+        if not tasks:
+            print("No tasks found.")
+            return None
+        for task in tasks:
+            status = "✓" if task.completed else " "
+            print(f"{task.id}. [{status}] {task.title}")
+        moves = []
+        if next_cursor is not None:
+            moves.append("n: next page")
+        if len(cursors) > 1:
+            moves.append("p: previous page")
+        hint = f" ({', '.join(moves)})" if moves else ""
+        answer = input(f"{prompt}{hint}: ").strip()
+        if answer.lower() == "n" and next_cursor is not None:
+            cursors.append(next_cursor)
+        elif answer.lower() == "p" and len(cursors) > 1:
+            cursors.pop()
+        else:
+            return answer
 
 def main():
-    todo_list = TodoList()
+    todo_list = TodoList(lazy=True, write_behind=True)
     
     while True:
         print("\n=== Todo List Manager ===")
@@ -119,28 +3223,19 @@ def main():
             print("Task added successfully!")
 
         elif choice == '2':
-            tasks = todo_list.get_tasks()
-            if not tasks:
-                print("No tasks found.")
-            else:
-                print("\nCurrent Tasks:")
-                for i, task in enumerate(tasks):
-                    status = "✓" if task.completed else " "
-                    print(f"{i + 1}. [{status}] {task.title}")
+            # Show what other processes have saved in the meantime too
+            todo_list.refresh()
+            counts = todo_list.counts()
+            if counts["total"]:
+                print(f"\nCurrent Tasks ({counts['total']}, {counts['pending']} pending):")
+            browse(todo_list, "Press Enter to go back")
 
         elif choice == '3':
-            tasks = todo_list.get_tasks()
-            if not tasks:
-                print("No tasks found.")
+            answer = browse(todo_list, "Enter task number to complete")
+            if answer is None:
                 continue
-                
-            for i, task in enumerate(tasks):
-                status = "✓" if task.completed else " "
-                print(f"{i + 1}. [{status}] {task.title}")
-                
             try:
-                index = int(input("Enter task number to complete: ")) - 1
-                if todo_list.complete_task(index):
+                if todo_list.complete_task_by_id(int(answer)):
                     print("Task marked as completed!")
                 else:
                     print("Invalid task number.")
@@ -148,18 +3243,11 @@ def main():
                 print("Please enter a valid number.")
 
         elif choice == '4':
-            tasks = todo_list.get_tasks()
-            if not tasks:
-                print("No tasks found.")
+            answer = browse(todo_list, "Enter task number to delete")
+            if answer is None:
                 continue
-                
-            for i, task in enumerate(tasks):
-                status = "✓" if task.completed else " "
-                print(f"{i + 1}. [{status}] {task.title}")
-                
             try:
-                index = int(input("Enter task number to delete: ")) - 1
-                if todo_list.delete_task(index):
+                if todo_list.delete_task_by_id(int(answer)):
                     print("Task deleted successfully!")
                 else:
                     print("Invalid task number.")
@@ -167,25 +3255,19 @@ def main():
                 print("Please enter a valid number.")
 
         elif choice == '5':
-            tasks = todo_list.get_tasks()
-            if not tasks:
-                print("No tasks found.")
+            answer = browse(todo_list, "Enter task number to update")
+            if answer is None:
                 continue
-                
-            for i, task in enumerate(tasks):
-                status = "✓" if task.completed else " "
-                print(f"{i + 1}. [{status}] {task.title}")
-                
             try:
-                index = int(input("Enter task number to update: ")) - 1
+                task_id = int(answer)
                 title = input("Enter new title (or press Enter to skip): ")
                 description = input("Enter new description (or press Enter to skip): ")
                 due_date = input("Enter new due date (YYYY-MM-DD) (or press Enter to skip): ")
                 
-                if todo_list.update_task(index, 
-                                       title if title else None,
-                                       description if description else None,
-                                       due_date if due_date else None):
+                if todo_list.update_task_by_id(task_id,
+                                               title if title else None,
+                                               description if description else None,
+                                               due_date if due_date else None):
                     print("Task updated successfully!")
                 else:
                     print("Invalid task number.")
@@ -193,19 +3275,12 @@ def main():
                 print("Please enter a valid number.")
 
         elif choice == '6':
-            tasks = todo_list.get_tasks()
-            if not tasks:
-                print("No tasks found.")
+            answer = browse(todo_list, "Enter task number to view details")
+            if answer is None:
                 continue
-                
-            for i, task in enumerate(tasks):
-                status = "✓" if task.completed else " "
-                print(f"{i + 1}. [{status}] {task.title}")
-                
             try:
-                index = int(input("Enter task number to view details: ")) - 1
-                if 0 <= index < len(tasks):
-                    task = tasks[index]
+                task = todo_list.get_task(int(answer))
+                if task is not None:
                     print("\nTask Details:")
                     print(f"Title: {task.title}")
                     print(f"Description: {task.description}")
@@ -218,11 +3293,156 @@ def main():
                 print("Please enter a valid number.")
 
         elif choice == '7':
+            todo_list.close()
             print("Goodbye!")
             break
 
         else:
             print("Invalid choice. Please try again.")
 
+def format_task(task):
+    status = "✓" if task.completed else " "
+    due = f" (due {task.due_date})" if task.due_date else ""
+    return f"{task.id}. [{status}] {task.title}{due}\n"
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="todo", description="Manage the todo list without the interactive menu."
+    )
+    parser.add_argument("--file", default="todo.json", help="task file (default: todo.json)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add a task")
+    add.add_argument("title")
+    add.add_argument("-d", "--description", default="")
+    add.add_argument("--due", help="due date (YYYY-MM-DD)")
+
+    list_ = commands.add_parser("list", help="list tasks")
+    list_.add_argument("--pending", action="store_true", help="only incomplete tasks")
+    list_.add_argument("--due-before", metavar="YYYY-MM-DD",
+                       help="only tasks due before this date")
+    list_.add_argument("--contains", metavar="TEXT", help="only tasks whose title contains TEXT")
+    list_.add_argument("--sort", choices=tuple(SORT_KEYS), help="sort by this field")
+    list_.add_argument("--reverse", action="store_true", help="sort in descending order")
+    list_.add_argument("--limit", type=int, default=50, metavar="N",
+                       help="tasks per page (default: 50)")
+    list_.add_argument("--after", type=int, metavar="ID",
+                       help="start after this task id; the cursor printed under each page")
+    list_.add_argument("--all", action="store_true", help="list every task, not one page")
+
+    done = commands.add_parser("done", help="mark tasks completed")
+    done.add_argument("ids", nargs="+", type=int, metavar="ID")
+
+    rm = commands.add_parser("rm", help="delete tasks")
+    rm.add_argument("ids", nargs="+", type=int, metavar="ID")
+
+    search = commands.add_parser("search", help="find tasks by words in title or description")
+    search.add_argument("query", help='words to match, e.g. "milk OR bread*"')
+    search.add_argument("--archive", action="store_true", help="search archived tasks instead")
+
+    archive = commands.add_parser("archive", help="move old completed tasks to the archive")
+    archive.add_argument("--days", type=int, default=30,
+                         help="archive tasks created more than this many days ago (default: 30)")
+
+    restore = commands.add_parser("restore", help="move tasks back from the archive")
+    restore.add_argument("ids", nargs="+", type=int, metavar="ID")
+
+    commands.add_parser("export", help="write all tasks as JSON to stdout")
+
+    convert = commands.add_parser(
+        "convert", help="copy a task file between JSON and the binary format (.bin)"
+    )
+    convert.add_argument("source")
+    convert.add_argument("target")
+    return parser
+
+def run_command(argv=None):
+    """Run one non-interactive command and return its exit code"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        if args.source.endswith(".bin") == args.target.endswith(".bin"):
+            parser.error("convert needs one .bin file and one JSON file")
+        if args.source.endswith(".bin"):
+            convert_binary_to_json(args.source, args.target)
+        else:
+            convert_json_to_binary(args.source, args.target)
+        return 0
+    # Lazy + journal: reads stream from disk and writes append one record;
+    # add doesn't even read the snapshot, only the .meta sidecar and journal
+    todo_list = open_todo_list(args.file, journal=True, lazy=True, persist_index=True)
+    out = []
+
+    if args.command == "add":
+        task = todo_list.add_task(args.title, args.description, args.due)
+        out.append(f"{task.id}\n")
+
+    elif args.command == "list":
+        # Not loaded, so this is one streaming pass over the file
+        query = todo_list.query()
+        if args.pending:
+            query = query.where(completed=False)
+        if args.due_before:
+            try:
+                query = query.where(due_before=args.due_before)
+            except ValueError:
+                parser.error("--due-before must be YYYY-MM-DD")
+        if args.contains:
+            query = query.where(title_contains=args.contains)
+        if args.limit < 1:
+            parser.error("--limit must be at least 1")
+        if args.sort:
+            if args.after is not None:
+                parser.error("--after pages in id order and can't be used with --sort")
+            query = query.order_by(("-" if args.reverse else "") + args.sort)
+            if not args.all:
+                query = query.limit(args.limit)
+            out.extend(format_task(task) for task in query)
+        elif args.all:
+            out.extend(format_task(task) for task in query)
+        else:
+            tasks, cursor = query.page(args.after, args.limit)
+            out.extend(format_task(task) for task in tasks)
+            if cursor is not None:
+                sys.stdout.write("".join(out))
+                sys.stderr.write(f"todo: more tasks; add --after {cursor} for the next page\n")
+                return 0
+
+    elif args.command in ("done", "rm"):
+        missing = [task_id for task_id in args.ids if todo_list.get_task(task_id) is None]
+        if args.command == "done":
+            todo_list.complete_tasks(args.ids)
+        else:
+            todo_list.delete_tasks(args.ids)
+        if missing:
+            sys.stderr.write(f"todo: no task with id {', '.join(map(str, missing))}\n")
+            return 1
+
+    elif args.command == "search":
+        search = todo_list.search_archive if args.archive else todo_list.search
+        out.extend(format_task(task) for task in search(args.query))
+
+    elif args.command == "archive":
+        out.append(f"{todo_list.archive(args.days)}\n")
+
+    elif args.command == "restore":
+        missing = [task_id for task_id in args.ids
+                   if todo_list.archive_list.get_task(task_id) is None]
+        out.extend(format_task(task) for task in todo_list.restore(args.ids))
+        if missing:
+            sys.stdout.write("".join(out))
+            sys.stderr.write(f"todo: no archived task with id {', '.join(map(str, missing))}\n")
+            return 1
+
+    elif args.command == "export":
+        out.append(json.dumps([task.to_dict() for task in todo_list.iter_tasks_from_file()],
+                              indent=2))
+        out.append("\n")
+
+    sys.stdout.write("".join(out))
+    return 0
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_command())
     main()
\ No newline at end of file
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from todo import ThreadSafeTodoList
+
+TASK_PATH = re.compile(r"/tasks/(\d+)")
+COMPLETE_PATH = re.compile(r"/tasks/(\d+)/complete")
+
+class BadRequest(Exception):
+    pass
+
+def task_fields(body):
+    """title/description/due_date from a request body, checked for type"""
+    fields = {}
+    for field in ("title", "description", "due_date"):
+        value = body.get(field)
+        if value is not None and not isinstance(value, str):
+            raise BadRequest(f"{field} must be a string")
+        fields[field] = value
+    return fields
+
+def apply_operation(todo_list, operation):
+    """Run one /batch operation; returns a task dict for "add", else a bool"""
+    if not isinstance(operation, dict):
+        raise BadRequest("each operation must be an object")
+    op = operation.get("op")
+    if op == "add":
+        fields = task_fields(operation)
+        if not fields["title"]:
+            raise BadRequest("add needs a title")
+        return todo_list.add_task(fields["title"], fields["description"] or "",
+                                  fields["due_date"]).to_dict()
+    if op not in ("complete", "delete", "update"):
+        raise BadRequest(f"unknown op {op!r}")
+    task_id = operation.get("id")
+    if not isinstance(task_id, int):
+        raise BadRequest(f"{op} needs an integer id")
+    if op == "complete":
+        return todo_list.complete_task_by_id(task_id)
+    if op == "delete":
+        return todo_list.delete_task_by_id(task_id)
+    return todo_list.update_task_by_id(task_id, **task_fields(operation))
+
+class TodoServer(ThreadingHTTPServer):
+    """HTTP/JSON front end to one TodoList, loaded once for the server's life"""
+
+    daemon_threads = True
+
+    def __init__(self, address, todo_list, verbose=False):
+        super().__init__(address, TodoHandler)
+        self.todo_list = todo_list
+        self.verbose = verbose
+        # ETags from an earlier run must never match this one's versions
+        self.etag_prefix = os.urandom(4).hex()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def task_list(self, pending_only):
+        """Return (ETag, JSON body) for the task list, serialized once per version"""
+        # Read the version first so the ETag can only be older than the body,
+        # which costs a resend but never serves a stale 304.
+        version = self.todo_list.version
+        etag = f'"{self.etag_prefix}-{version}-{int(pending_only)}"'
+        # Held while serializing, so concurrent requests share one build
+        with self._cache_lock:
+            cached = self._cache.get(pending_only)
+            if cached is None or cached[0] != etag:
+                tasks = self.todo_list.get_tasks(include_completed=not pending_only)
+                cached = etag, json.dumps([task.to_dict() for task in tasks]).encode()
+                self._cache[pending_only] = cached
+        return cached
+
+class TodoHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; don't let Nagle hold the
+    # body back waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            body = self.read_body()
+            self.route(method, url.path, parse_qs(url.query), body)
+        except BadRequest as e:
+            self.send_json(400, {"error": str(e)})
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise BadRequest("body is not valid JSON")
+
+    def route(self, method, path, query, body):
+        todo_list = self.server.todo_list
+        if path == "/tasks":
+            if method == "GET":
+                pending_only = query.get("pending", ["0"])[0] not in ("0", "false")
+                etag, payload = self.server.task_list(pending_only)
+                if etag in self.headers.get("If-None-Match", ""):
+                    self.send(304, b"", {"ETag": etag})
+                else:
+                    self.send(200, payload, {"ETag": etag})
+            elif method == "POST":
+                fields = task_fields(self.require_object(body))
+                if not fields["title"]:
+                    raise BadRequest("title is required")
+                task = todo_list.add_task(fields["title"], fields["description"] or "",
+                                          fields["due_date"])
+                self.send_json(201, task.to_dict())
+            else:
+                self.send_json(405, {"error": "method not allowed"})
+            return
+        if path in ("/stats", "/metrics"):
+            if method != "GET":
+                self.send_json(405, {"error": "method not allowed"})
+            elif path == "/stats":
+                self.send_json(200, todo_list.stats())
+            else:
+                self.send(200, todo_list.stats("prometheus").encode(),
+                          {"Content-Type": "text/plain; version=0.0.4"})
+            return
+        if path == "/batch":
+            if method != "POST":
+                self.send_json(405, {"error": "method not allowed"})
+                return
+            if not isinstance(body, list):
+                raise BadRequest("body must be a list of operations")
+            # One save for the lot; a bad operation undoes the ones before it
+            with todo_list.batch():
+                results = [apply_operation(todo_list, operation) for operation in body]
+            self.send_json(200, {"results": results})
+            return
+        match = COMPLETE_PATH.fullmatch(path)
+        if match:
+            task_id = int(match[1])
+            if method != "POST":
+                self.send_json(405, {"error": "method not allowed"})
+            elif todo_list.complete_task_by_id(task_id):
+                self.send_task(task_id)
+            else:
+                self.send_missing(task_id)
+            return
+        match = TASK_PATH.fullmatch(path)
+        if match:
+            task_id = int(match[1])
+            if method == "GET":
+                self.send_task(task_id)
+            elif method == "PATCH":
+                fields = task_fields(self.require_object(body))
+                if todo_list.update_task_by_id(task_id, **fields):
+                    self.send_task(task_id)
+                else:
+                    self.send_missing(task_id)
+            elif method == "DELETE":
+                if todo_list.delete_task_by_id(task_id):
+                    self.send(204, b"")
+                else:
+                    self.send_missing(task_id)
+            else:
+                self.send_json(405, {"error": "method not allowed"})
+            return
+        self.send_json(404, {"error": f"no such resource {path}"})
+
+    @staticmethod
+    def require_object(body):
+        if not isinstance(body, dict):
+            raise BadRequest("body must be a JSON object")
+        return body
+
+    def send_task(self, task_id):
+        task = self.server.todo_list.get_task(task_id)
+        if task is None:
+            self.send_missing(task_id)
+        else:
+            self.send_json(200, task.to_dict())
+
+    def send_missing(self, task_id):
+        self.send_json(404, {"error": f"no task with id {task_id}"})
+
+    def send_json(self, status, data):
+        self.send(status, json.dumps(data).encode())
+
+    def send(self, status, payload, headers=None):
+        self.send_response(status)
+        headers = headers or {}
+        if payload and "Content-Type" not in headers:
+            self.send_header("Content-Type", "application/json")
+        # 204 and 304 responses never have a body, so carry no length either
+        if status not in (204, 304):
+            self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a todo list over HTTP/JSON")
+    parser.add_argument("--file", default="todo.json", help="task file (default: todo.json)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    # Instrumented for GET /stats (JSON) and /metrics (Prometheus)
+    todo_list = ThreadSafeTodoList(args.file, journal=True, instrument=True)
+    server = TodoServer((args.host, args.port), todo_list, verbose=args.verbose)
+    print(f"Serving {args.file} on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        todo_list.close()
+
+if __name__ == "__main__":
+    main()